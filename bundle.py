@@ -0,0 +1,337 @@
+from hashlib import sha1
+import json
+import os
+import struct
+import sys
+from time import time
+import zlib
+
+# each packed file carries its modification time since version 2
+MAGIC = b"SABUNDL2"
+
+# directories that get packed into bundles
+CACHE_DIRS = ["users", "subreddits", "history"]
+
+# uncompressed size a chunk is filled up to before it's written
+CHUNK_SIZE = 4 * 1048576
+
+
+def file_hash(path):
+    """
+    Returns the SHA-1 of a file's contents.
+    """
+
+    digest = sha1()
+
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(65536), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def read_index(bundleFile):
+    """
+    Reads the content index from the end of a bundle. Returns a
+    dict with the bundle's ID, the ID of the bundle it's based on
+    and an entry for every cached file as of that bundle.
+    """
+
+    with open(bundleFile, "rb") as f:
+        f.seek(-(len(MAGIC) + 8), os.SEEK_END)
+        trailer = f.read()
+
+        if trailer[8:] != MAGIC:
+            raise ValueError("{0} isn't a bundle.".format(bundleFile))
+
+        offset = struct.unpack(">Q", trailer[:8])[0]
+
+        f.seek(offset)
+        length = struct.unpack(">I", f.read(4))[0]
+
+        return json.loads(zlib.decompress(f.read(length)).decode("utf-8"))
+
+
+class BundleWriter(object):
+
+
+    def __init__(self, bundleFile):
+        """
+        Writes cached files into a bundle. Files are packed one
+        after another into chunks that get compressed on their own,
+        so a bundle can be imported while it's being read.
+        """
+
+        self.f = open(bundleFile, "wb")
+        self.f.write(MAGIC)
+
+        self.chunks = 0
+        self.pending = []
+        self.pendingSize = 0
+
+
+    def add(self, path, data, mtime):
+        """
+        Adds a file to the current chunk along with its
+        modification time. Returns the number of the chunk it
+        went into.
+        """
+
+        name = path.encode("utf-8")
+
+        self.pending.append(struct.pack(">H", len(name)) + name + struct.pack(">QQ", mtime, len(data)) + data)
+        self.pendingSize += len(data)
+
+        chunk = self.chunks
+
+        if self.pendingSize >= CHUNK_SIZE:
+            self.flush()
+
+        return chunk
+
+
+    def flush(self):
+        """
+        Compresses and writes out the current chunk.
+        """
+
+        if len(self.pending) == 0:
+            return
+
+        payload = zlib.compress(b''.join(self.pending), 9)
+
+        self.f.write(struct.pack(">I", len(payload)))
+        self.f.write(payload)
+
+        self.chunks += 1
+        self.pending = []
+        self.pendingSize = 0
+
+
+    def close(self, index):
+        """
+        Writes the last chunk and the content index, then closes
+        the bundle. A zero length marks the end of the chunks.
+        """
+
+        self.flush()
+        self.f.write(struct.pack(">I", 0))
+
+        offset = self.f.tell()
+        payload = zlib.compress(json.dumps(index, sort_keys=True).encode("utf-8"), 9)
+
+        self.f.write(struct.pack(">I", len(payload)))
+        self.f.write(payload)
+        self.f.write(struct.pack(">Q", offset) + MAGIC)
+
+        self.f.close()
+
+
+def export_bundle(bundleFile, baseFile=None):
+    """
+    Packs the user and drilldown caches into a bundle. Give it a
+    base bundle to only pack the files that changed since that
+    one. Returns the number of files packed.
+    """
+
+    base = {"entries": {}}
+
+    if baseFile is not None:
+        base = read_index(baseFile)
+
+    entries = {}
+    writer = BundleWriter(bundleFile)
+    packed = 0
+
+    for directory in CACHE_DIRS:
+        if not(os.path.isdir(directory)):
+            continue
+
+        for name in sorted(os.listdir(directory)):
+            path = "{0}/{1}".format(directory, name)
+
+            if not(os.path.isfile(path)):
+                continue
+
+            stat = os.stat(path)
+            old = base["entries"].get(path)
+
+            # files that look untouched aren't hashed again
+            if old is not None and old["size"] == stat.st_size and old["mtime"] == int(stat.st_mtime):
+                entries[path] = dict(old, chunk=None)
+                continue
+
+            digest = file_hash(path)
+
+            if old is not None and old["sha1"] == digest:
+                entries[path] = dict(old, chunk=None, mtime=int(stat.st_mtime))
+                continue
+
+            with open(path, "rb") as f:
+                chunk = writer.add(path, f.read(), int(stat.st_mtime))
+
+            entries[path] = {"sha1": digest, "size": stat.st_size, "mtime": int(stat.st_mtime), "chunk": chunk}
+            packed += 1
+
+            print("\r{0} files packed.".format(packed), end='')
+
+    index = {
+        "id": sha1(str(time()).encode("utf-8") + bundleFile.encode("utf-8")).hexdigest()[:12],
+        "base": base.get("id"),
+        "created": int(time()),
+        "entries": entries
+    }
+
+    writer.close(index)
+    print('')
+
+    return packed
+
+
+def read_chunks(f):
+    """
+    Yields (path, modification time, data) for every file in a
+    bundle, reading it front to back one chunk at a time. f can
+    be a pipe.
+    """
+
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a bundle.")
+
+    while True:
+        length = struct.unpack(">I", f.read(4))[0]
+
+        if length == 0:
+            return
+
+        payload = zlib.decompress(f.read(length))
+        position = 0
+
+        while position < len(payload):
+            nameLength = struct.unpack(">H", payload[position:position + 2])[0]
+            position += 2
+
+            path = payload[position:position + nameLength].decode("utf-8")
+            position += nameLength
+
+            mtime, dataLength = struct.unpack(">QQ", payload[position:position + 16])
+            position += 16
+
+            yield (path, mtime, payload[position:position + dataLength])
+            position += dataLength
+
+
+def import_bundle(f, force=False):
+    """
+    Unpacks a bundle straight into the cache directories as it's
+    read, without any temporary files. A packed file replaces the
+    local copy if the local copy is older, so an incremental
+    bundle brings the files it carries up to date. Local files
+    that changed after the bundle's copy are kept unless force is
+    True. Unpacked files keep their modification time from the
+    bundle, so later exports and imports can compare them.
+    Returns the number of files written and the number kept.
+    """
+
+    written = 0
+    kept = 0
+
+    for path, mtime, data in read_chunks(f):
+        directory = os.path.dirname(path)
+
+        # never write outside the cache directories
+        if directory not in CACHE_DIRS or os.path.basename(path) in ['', '.', '..']:
+            continue
+
+        if not(os.path.isdir(directory)):
+            os.mkdir(directory)
+
+        if os.path.isfile(path) and not(force):
+            localTime = int(os.stat(path).st_mtime)
+
+            if localTime > mtime:
+                kept += 1
+                continue
+
+            # same file as the last import
+            if localTime == mtime and os.path.getsize(path) == len(data):
+                continue
+
+        with open(path, "wb") as out:
+            out.write(data)
+
+        os.utime(path, (mtime, mtime))
+        written += 1
+
+        print("\r{0} files unpacked.".format(written), end='')
+
+    print('')
+
+    return (written, kept)
+
+
+def main():
+    """
+    Moves the caches between machines. Usage:
+
+        python bundle.py export <bundle> [--since <older bundle>]
+        python bundle.py import <bundle or -> [--force]
+        python bundle.py list <bundle>
+
+    --since only packs the files that changed after the older
+    bundle was made. Import a full bundle first, then the
+    incremental ones in order. Each packed file replaces an older
+    local copy. Local files that changed after the bundle's copy
+    are kept, unless --force is passed. Pass - to import from
+    stdin.
+    """
+
+    args = sys.argv[1:]
+
+    if len(args) < 2:
+        print(main.__doc__)
+        sys.exit(1)
+
+    command = args[0]
+    start = time()
+
+    if command == "export":
+        baseFile = None
+
+        if "--since" in args:
+            baseFile = args[args.index("--since") + 1]
+
+        packed = export_bundle(args[1], baseFile)
+        print("Packed {0} files into {1} in {2:.1f} seconds.".format(packed, args[1], time() - start))
+
+    elif command == "import":
+        force = "--force" in args
+
+        if args[1] == '-':
+            written, kept = import_bundle(sys.stdin.buffer, force)
+
+        else:
+            with open(args[1], "rb") as f:
+                written, kept = import_bundle(f, force)
+
+        print("Unpacked {0} files in {1:.1f} seconds.".format(written, time() - start))
+
+        if kept > 0:
+            print("Kept {0} local files that are newer than the bundle's copies. Pass --force to replace them.".format(kept))
+
+    elif command == "list":
+        index = read_index(args[1])
+        entries = index["entries"]
+
+        packed = [path for path in entries if entries[path]["chunk"] is not None]
+
+        print("Bundle {0}, based on {1}".format(index["id"], index["base"] or "nothing"))
+        print("{0} files in the caches, {1} packed in this bundle.".format(len(entries), len(packed)))
+
+    else:
+        print(main.__doc__)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+from collections import Counter
+from hashlib import sha1
+import json
+import sqlite3 as db
+from time import sleep, time
+import zlib
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from exceptions import CassetteMiss
+from handlers import HandlerLayer
+
+
+def request_key(request):
+    """
+    Returns the key a prepared request is stored under. Requests
+    with the same method, URL and body share a key, so replaying
+    doesn't depend on anything else that changes between runs.
+    """
+
+    body = request.body or b''
+
+    if not isinstance(body, bytes):
+        body = body.encode("utf-8")
+
+    return "{0} {1} {2}".format(request.method, request.url, sha1(body).hexdigest())
+
+
+class Cassette(object):
+
+
+    def __init__(self, cassetteFile):
+        """
+        Opens the file that exchanges get recorded to or replayed
+        from. Each response body is compressed and the exchanges
+        are indexed by request key, so a replay can look up any of
+        them without reading the rest.
+        """
+
+        # used from the harvest threads too, one at a time
+        self.con = db.connect(cassetteFile, check_same_thread=False)
+        cur = self.con.cursor()
+
+        cur.execute("CREATE TABLE IF NOT EXISTS exchange(Key TEXT, Seq INT, Url TEXT, Status INT, Reason TEXT, Headers TEXT, Body BLOB, Elapsed REAL)")
+        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS exchange_key ON exchange(Key, Seq)")
+
+        self.con.commit()
+
+        # how many times each key has come up in this run
+        self.seen = Counter()
+
+
+    def clear(self):
+        """
+        Drops every recorded exchange.
+        """
+
+        self.con.execute("DELETE FROM exchange")
+        self.con.commit()
+
+
+    def record(self, request, response, elapsed):
+        """
+        Stores a request and the response it got. Give it the
+        prepared request, the response and how many seconds it took.
+        """
+
+        key = request_key(request)
+        seq = self.seen[key]
+        self.seen[key] += 1
+
+        self.con.execute(
+            "INSERT OR REPLACE INTO exchange VALUES(?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, seq, response.url, response.status_code, response.reason,
+             json.dumps(dict(response.headers)), zlib.compress(response.content), elapsed)
+        )
+
+        self.con.commit()
+
+
+    def play(self, request):
+        """
+        Finds the recorded response to a request. A request that
+        was made several times gets its responses back in the
+        order they were recorded, and the last one after that.
+        Returns the response and how long it took to record, or
+        raises CassetteMiss.
+        """
+
+        key = request_key(request)
+        seq = self.seen[key]
+        self.seen[key] += 1
+
+        cur = self.con.cursor()
+        cur.execute(
+            "SELECT Url, Status, Reason, Headers, Body, Elapsed FROM exchange WHERE Key=? AND Seq<=? ORDER BY Seq DESC LIMIT 1",
+            (key, seq)
+        )
+
+        row = cur.fetchone()
+
+        if row is None:
+            raise CassetteMiss("No recorded response for {0} {1}".format(request.method, request.url))
+
+        url, status, reason, headers, body, elapsed = row
+
+        response = Response()
+        response.url = url
+        response.status_code = status
+        response.reason = reason
+        response.headers = CaseInsensitiveDict(json.loads(headers))
+        response._content = zlib.decompress(body)
+        response.encoding = "utf-8"
+        response.request = request
+
+        return (response, elapsed)
+
+
+    def close(self):
+        """
+        Closes the cassette's file.
+        """
+
+        self.con.close()
+
+
+class RecordingHandler(HandlerLayer):
+
+
+    def __init__(self, handler, cassetteFile):
+        """
+        Passes every request down to the real handler and records
+        it along with its response and how long it took, rate
+        limiting included. Recording starts a fresh cassette.
+        """
+
+        HandlerLayer.__init__(self, handler)
+
+        self.cassette = Cassette(cassetteFile)
+        self.cassette.clear()
+
+
+    def request(self, **kwargs):
+        start = time()
+        response = self.handler.request(**kwargs)
+
+        self.cassette.record(kwargs["request"], response, time() - start)
+
+        return response
+
+
+class ReplayHandler(HandlerLayer):
+
+
+    def __init__(self, cassetteFile, simulateLatency):
+        """
+        Answers every request from a recorded cassette without
+        touching the network. With simulateLatency on, each answer
+        takes as long as it did when it was recorded.
+        """
+
+        HandlerLayer.__init__(self, None)
+
+        self.cassette = Cassette(cassetteFile)
+        self.simulateLatency = simulateLatency
+
+        self.misses = 0
+
+
+    def request(self, **kwargs):
+        try:
+            response, elapsed = self.cassette.play(kwargs["request"])
+
+        except CassetteMiss:
+            self.misses += 1
+            raise
+
+        if(self.simulateLatency):
+            sleep(elapsed)
+
+        return response
+
+
+    @classmethod
+    def evict(cls, urls):
+        """
+        Nothing is cached here, so there's nothing to evict.
+        """
+
+        return 0
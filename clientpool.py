@@ -0,0 +1,118 @@
+from threading import Lock
+from time import time
+
+
+class ClientPool(object):
+
+
+    def __init__(self, cooldown):
+        """
+        Spreads read-only requests across several logged in
+        accounts, each with its own rate limit. Accounts whose
+        handler got a 429 answer are sidelined for cooldown
+        seconds. Clients are logged in praw.Reddit objects, whose
+        cookies and handlers a PoolHandler sends requests with.
+        """
+
+        self.cooldown = cooldown
+
+        # [name, client, handler, uses] for each account
+        self.accounts = []
+
+        # accounts that couldn't log in, with the reason
+        self.failed = []
+
+        self.position = 0
+        self.lock = Lock()
+
+
+    def add(self, name, client, handler=None):
+        """
+        Adds a logged in account. Give it the name of the account,
+        its client and the handler at the bottom of its stack,
+        which has to keep the time of its last 429 answer in
+        throttledAt. Without a handler the account is never
+        sidelined.
+        """
+
+        with self.lock:
+            self.accounts.append([name, client, handler, 0])
+
+
+    def fail(self, name, reason):
+        """
+        Keeps track of an account that couldn't log in.
+        """
+
+        with self.lock:
+            self.failed.append((name, str(reason)))
+
+
+    def throttled_at(self, account):
+        """
+        Returns when an account was last throttled, or None.
+        """
+
+        handler = account[2]
+
+        if handler is None:
+            return None
+
+        return handler.throttledAt
+
+
+    def available(self, account):
+        """
+        Returns True if an account isn't sidelined.
+        """
+
+        throttledAt = self.throttled_at(account)
+
+        return throttledAt is None or time() - throttledAt >= self.cooldown
+
+
+    def next(self):
+        """
+        Returns the client for the next read-only request, taking
+        turns between the accounts that aren't sidelined. If every
+        account is sidelined, the one that was throttled longest
+        ago is used.
+        """
+
+        with self.lock:
+            if len(self.accounts) == 0:
+                raise IndexError("The pool has no accounts.")
+
+            for i in range(len(self.accounts)):
+                account = self.accounts[(self.position + i) % len(self.accounts)]
+
+                if(self.available(account)):
+                    self.position = (self.position + i + 1) % len(self.accounts)
+                    break
+
+            else:
+                account = min(self.accounts, key=self.throttled_at)
+
+            account[3] += 1
+
+            return account[1]
+
+
+    def report(self):
+        """
+        Returns a line saying how the requests were spread over
+        the accounts and which ones were left out.
+        """
+
+        used = ", ".join("{0}: {1}".format(name, uses) for name, client, handler, uses in self.accounts)
+        sidelined = [account[0] for account in self.accounts if not(self.available(account))]
+
+        line = "Reads per account: {0}.".format(used)
+
+        if len(sidelined) > 0:
+            line += " Sidelined: {0}.".format(", ".join(sidelined))
+
+        if len(self.failed) > 0:
+            line += " Failed to log in: {0}.".format(", ".join(name for name, reason in self.failed))
+
+        return line
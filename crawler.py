@@ -1,17 +1,34 @@
-from collections import Counter
+from collections import Counter, defaultdict, deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
+from itertools import chain
 import logging
-from math import sqrt
 import operator
 import os
 import sqlite3 as db
 from sqlite3 import OperationalError
 from socket import timeout
+from threading import local
+from time import sleep, time
 import praw
 from praw.errors import *
 from requests.exceptions import HTTPError
 from simpleconfigparser import simpleconfigparser
+from cassette import RecordingHandler, ReplayHandler
+from clientpool import ClientPool
+from depth import OverviewDepth, PAGE_SIZE
 from exceptions import *
+from handlers import AccountHandler, CountingHandler, LockingHandler, PoolHandler
+from history import DrilldownHistory
+from histogram import bucket_of, write_histogram
+from httpcache import ConditionalCacheHandler, report_caches
+from progress import ProgressivePost
+from registry import AccountRegistry
+from render import collect_similarities, drilldown_path, format_drilldown, read_drilldown, read_fidelity, similarity_from_cache
+from simindex import SimilarityIndex
+from usercache import count_undated, ensure_aggregate, ensure_created, get_truncation, is_cached, needs_dates, read_scores, scan_cached
+from userset import UserSet
+from workqueue import WorkQueue
 
 
 class SubredditAnalysis(object):
@@ -46,6 +63,18 @@ class SubredditAnalysis(object):
         # a user's overview
         self.overviewLimit = int(self.config.main.overviewLimit)
 
+        # overviewLimit shrinks for reduced drilldowns, this doesn't
+        self.fullOverviewLimit = self.overviewLimit
+
+        # only count items from the last this many days of each
+        # user's history. 0 counts everything
+        self.window = int(self.config.main.window)
+
+        # processes that read cached users in get_subs, and how
+        # many users each of them is handed at a time
+        self.scanProcesses = int(self.config.main.scanProcesses)
+        self.scanBatchSize = int(self.config.main.scanBatchSize)
+
         # don't include comments/submissions beneath this score
         self.minScore = int(self.config.main.minScore)
 
@@ -61,6 +90,78 @@ class SubredditAnalysis(object):
         # sets the cap for sample size
         self.userLimit = int(self.config.main.userLimit)
 
+        # "threads" expands every hot thread's comments to find users,
+        # "listings" pages through the subreddit's newest comments and
+        # submissions instead
+        self.harvestMode = self.config.main.harvestMode
+
+        # only take users from the last this many hours in
+        # listings mode. 0 turns the window off
+        self.harvestWindow = int(self.config.main.harvestWindow)
+
+        # how many hot threads get their comments expanded at once
+        # in threads mode. Each account still makes one request at
+        # a time, so more workers than accounts don't help
+        self.harvestWorkers = int(self.config.main.harvestWorkers)
+
+        # each harvest thread's own client, since praw can't share
+        # one between threads
+        self.threadClients = local()
+
+        # edges of the score buckets that the overlap tallies are
+        # kept in, so drilldowns for other minimum scores can be
+        # worked out from the stored data
+        self.scoreBuckets = sorted(set(
+            [int(edge) for edge in self.config.main.scoreBuckets.split(',')] + [self.minScore]
+        ))
+
+        # stop reading a user's overview once it stops
+        # turning up new subreddits
+        self.adaptiveDepth = self.config.main.getboolean("adaptiveDepth")
+
+        # how many pages in a row without a new subreddit
+        # before an overview is cut short
+        self.stalePages = int(self.config.main.stalePages)
+
+        # always read at least this many pages of an overview
+        self.minPages = int(self.config.main.minPages)
+
+        # keep the similarity index up to date as drilldowns are added
+        self.indexing = self.config.index.getboolean("indexing")
+
+        # where the snapshot history of every drilldown is kept
+        self.historyDir = self.config.history.historyDir
+
+        # mention the changes since last month in the post title
+        self.historyTitle = self.config.history.getboolean("historyTitle")
+
+        # give counterpart drilldowns for similarity a smaller
+        # budget than the drilldown they're compared with
+        self.tieredSimilarity = self.config.main.getboolean("tieredSimilarity")
+
+        # limits used for counterpart drilldowns in tiered mode
+        self.counterpartScrapeLimit = int(self.config.main.counterpartScrapeLimit)
+        self.counterpartOverviewLimit = int(self.config.main.counterpartOverviewLimit)
+        self.counterpartUserLimit = int(self.config.main.counterpartUserLimit)
+
+        # submit drilldowns before the scan is done and edit
+        # them as it goes on
+        self.progressive = self.config.progress.getboolean("progressive")
+
+        # users scanned before the partial post goes up
+        self.firstPost = int(self.config.progress.firstPost)
+
+        # seconds between edits, unless the top subreddits change
+        self.editInterval = int(self.config.progress.editInterval)
+
+        # how many of the top topK subreddits have to change for
+        # an edit to go out early
+        self.topK = int(self.config.progress.topK)
+        self.topChange = int(self.config.progress.topChange)
+
+        # most edits before the final one
+        self.maxEdits = int(self.config.progress.maxEdits)
+
         # post drilldown to this subreddit
         self.post_to = self.config.main.post_to
 
@@ -71,265 +172,1271 @@ class SubredditAnalysis(object):
         self.postLogging = self.config.logging.getboolean("postLogging")
         self.errorLogging = self.config.logging.getboolean("errorLogging")
 
+        # split get_subs() across worker processes through
+        # a shared work queue
+        self.sharding = self.config.sharding.getboolean("sharding")
+
+        # location of the work queue's database file. Point every
+        # worker at the same file to share the work between them
+        self.queueFile = self.config.sharding.queueFile
+
+        # number of shards that users are hashed into
+        self.shards = int(self.config.sharding.shards)
+
+        # how many users a worker leases at a time
+        self.batchSize = int(self.config.sharding.batchSize)
+
+        # seconds before an unfinished lease is given to another worker
+        self.leaseTime = int(self.config.sharding.leaseTime)
+
+        # give up on a user after this many expired leases
+        self.maxAttempts = int(self.config.sharding.maxAttempts)
+
+        # seconds to wait between checks on the other workers
+        self.pollInterval = int(self.config.sharding.pollInterval)
+
+        # walk comment trees without keeping them around and
+        # hold the harvested users in a UserSet
+        self.lowMemory = self.config.memory.getboolean("lowMemory")
+
+        # megabytes the process may use before the users found
+        # get moved to disk in low memory mode
+        self.maxRSS = int(self.config.memory.maxRSS)
+
+        # where the users get moved to
+        self.spillFile = self.config.memory.spillFile
+
+        # the UserSet of the last harvest, which holds the spill
+        # file open until the next harvest
+        self.userSet = None
+
+        # records gone, suspended and bot accounts so that no
+        # requests get spent on them again
+        self.registry = AccountRegistry(
+            self.config.accounts.registryFile,
+            int(self.config.accounts.statusTTL)
+        )
+
+        # accounts that are never crawled, like high-volume bots
+        self.skipList = set()
+
+        # accounts whose first overview page comes to more items
+        # a day than this are recorded as bots. 0 turns it off
+        self.botRate = int(self.config.accounts.botRate)
+
+        # extra accounts to spread reads over, as
+        # (username, password) tuples
+        self.accounts = []
+
+        for entry in self.config.login.accounts.split(','):
+            if ':' in entry:
+                name, password = entry.strip().split(':', 1)
+                self.accounts.append((name, password))
+
+        # seconds a throttled account is left out of the pool
+        self.cooldown = int(self.config.login.cooldown)
+
         # banned defaults and former defaults since
         # reddit autosubscribes users to them
         self.banList = []
 
-        # list of users found in the target subreddit
-        self.userList = []
+        # list of users found in the target subreddit
+        self.userList = []
+
+        # list of overlapping subreddits
+        self.subredditList = []
+
+        # users per score bucket for each overlapping subreddit
+        self.histogram = defaultdict(Counter)
+
+        # counts requests, login() puts the real handler under it
+        self.handler = CountingHandler(None)
+
+        # caches listings between runs, one for each logged in
+        # account, set up by login()
+        self.httpCaches = []
+
+        # subreddit the last user list was harvested from
+        self.lastHarvest = None
+
+        # praw's handler for the main account, set up by login()
+        self.account = None
+
+        # spreads reads over several accounts, set up by login()
+        # when [login] lists extra accounts
+        self.pool = None
+
+        # client whose requests take turns between the accounts
+        # in the pool, one request at a time
+        self.readClient = None
+
+        # overviews cut short in adaptive mode
+        self.truncatedUsers = 0
+        self.pagesSkipped = 0
+
+        # users with items that have no date, which windowed
+        # drilldowns leave out
+        self.undatedUsers = 0
+
+        if(self.config.main.getboolean("banList")):
+            with open("banlist.txt", 'r') as f:
+                for subreddit in f.readlines():
+                    subreddit = subreddit.strip('\n')
+                    self.banList.append(subreddit)
+
+        if(self.config.accounts.getboolean("skipList")):
+            if(os.path.isfile("skiplist.txt")):
+                with open("skiplist.txt", 'r') as f:
+                    for user in f.readlines():
+                        user = user.strip('\n')
+
+                        if user:
+                            self.skipList.add(user)
+
+            else:
+                print("Could not find skiplist.txt.")
+
+    
+    def add_msg(self, msg=None, newline=False):
+        """
+        Simple function to make terminal output optional. Feed
+        it the message to print out. Can also tell it to print a 
+        newline if you want to.
+        """
+
+        if(self.verbose):
+            if msg is not None:
+                print(msg)
+
+            if(newline):
+                print('\n')
+
+
+    def skip_user(self, user):
+        """
+        Checks whether a user is worth crawling. Give it the name
+        of the user. Returns True for deleted accounts, accounts in
+        skiplist.txt and accounts that the registry has a status
+        for, so they can be passed over without any requests.
+        """
+
+        # comments from deleted accounts have no author
+        if user in ["None", "[deleted]"]:
+            return True
+
+        if user in self.skipList:
+            return True
+
+        return self.registry.status(user) is not None
+
+
+    def make_handler(self, account=None):
+        """
+        Builds the handler that praw sends its requests through.
+        The layer that counts requests is kept in self.handler and
+        sits under the HTTP cache, so only requests that actually
+        reach Reddit get counted. Give it the AccountHandler of an
+        extra account to build that account's handler instead,
+        whose requests are counted in self.handler too. Returns
+        the outermost layer.
+        """
+
+        mode = self.config.cassette.mode
+        cassetteFile = self.config.cassette.cassetteFile
+
+        if account is not None:
+            counter = CountingHandler(account, self.handler)
+
+        else:
+            if mode == "replay":
+                handler = ReplayHandler(cassetteFile, self.config.cassette.getboolean("simulateLatency"))
+
+            else:
+                self.account = AccountHandler()
+                handler = self.account
+
+                if mode == "record":
+                    handler = RecordingHandler(handler, cassetteFile)
+
+            self.handler = CountingHandler(handler)
+            counter = self.handler
+
+        outer = counter
+
+        if(self.config.httpcache.getboolean("httpCache")):
+            cache = ConditionalCacheHandler(
+                counter,
+                self.config.httpcache.cacheFile,
+                int(self.config.httpcache.maxAge),
+                int(self.config.httpcache.maxEntries),
+                [path.strip() for path in self.config.httpcache.cachePaths.split(',')]
+            )
+
+            self.httpCaches.append(cache)
+
+            outer = cache
+
+        # the harvest threads' clients share each account's layers
+        # and their files
+        if self.harvestWorkers > 1:
+            outer = LockingHandler(outer)
+
+        return outer
+
+
+    def report_requests(self):
+        """
+        Prints how many requests have been made since logging in
+        and how long they took altogether.
+        """
+
+        self.add_msg("{0} requests made, {1:.1f} seconds spent waiting on them.".format(
+            self.handler.count, self.handler.elapsed))
+
+        if isinstance(self.handler.handler, ReplayHandler):
+            self.add_msg("{0} requests weren't in the cassette.".format(self.handler.handler.misses))
+
+        if len(self.httpCaches) > 0:
+            self.add_msg(report_caches(self.httpCaches))
+
+        if self.pool is not None:
+            self.add_msg(self.pool.report())
+
+
+    def login(self, username, password):
+        """
+        This function logs the bot into its Reddit account.
+        It takes 2 arguments: the username and the password.
+        The extra accounts in the [login] section are logged in
+        too and put in self.pool along with this one.
+        """
+
+        self.client = praw.Reddit(user_agent=self.useragent, handler=self.make_handler())
+        print("Logging in as {0}...".format(username))
+        
+
+        self.client.login(username, password)
+        print("Login successful.")
+
+        # extra accounts can't be recorded or replayed
+        if len(self.accounts) > 0 and self.config.cassette.mode == "off":
+            self.login_pool(username)
+
+
+    def login_pool(self, username):
+        """
+        Logs in the extra accounts and puts them in a client pool
+        with the main account, which reads are then spread over.
+        Accounts that fail to log in are left out. Give it the
+        name of the main account.
+        """
+
+        self.pool = ClientPool(self.cooldown)
+        self.pool.add(username, self.client, self.account)
+
+        for name, password in self.accounts:
+            account = AccountHandler()
+            client = praw.Reddit(user_agent=self.useragent, handler=self.make_handler(account))
+
+            print("Logging in as {0}...".format(name))
+
+            try:
+                client.login(name, password)
+
+            except (InvalidUser, InvalidUserPass, RateLimitExceeded, APIException,
+                    ConnectionResetError, HTTPError, timeout) as e:
+                self.add_msg("Couldn't log in as {0}, leaving it out. {1}".format(name, e))
+                self.pool.fail(name, e)
+                continue
+
+            self.pool.add(name, client, account)
+
+        # every request this client makes goes out as the next
+        # account in the pool, and a throttled one goes out again
+        # as each of the others
+        self.readClient = praw.Reddit(
+            user_agent=self.useragent,
+            handler=PoolHandler(self.pool.next, len(self.pool.accounts)),
+            disable_update_check=True
+        )
+
+        print("Reading with {0} accounts.".format(len(self.pool.accounts)))
+
+
+    def reader(self):
+        """
+        Returns the client to use for read-only requests. With a
+        pool, each HTTP request it makes, including every page of
+        an overview and every batch of more comments, goes out as
+        the next account. Without one it's the main account.
+        Posting and flair always use self.client.
+        """
+
+        if self.readClient is None:
+            return self.client
+
+        return self.readClient
+
+
+    def get_users(self, subreddit):
+        """
+        This function creates a list of users that posted in
+        the subreddit which is being scanned. The data from these
+        users is then collected to determine where else they post.
+        It takes 1 argument, which is the subreddit to be scanned.
+        It returns a list of users.
+        """
+
+        print("Getting users for /r/{0}...".format(subreddit))
+
+        if(self.lowMemory):
+            # the last drilldown is done with its users, so close
+            # its spill file before the new set clears it away
+            if self.userSet is not None:
+                self.userSet.close()
+
+            self.userSet = UserSet(self.spillFile, self.maxRSS)
+            self.userList = self.userSet
+
+        requestsBefore = self.handler.count
+        startTime = time()
+
+        if(self.harvestMode == "listings"):
+            self.get_users_from_listings(subreddit)
+
+        else:
+            self.get_users_from_threads(subreddit)
+
+        self.report_harvest(subreddit, len(self.userList), self.handler.count - requestsBefore, time() - startTime)
+
+        # get_subs() runs on these users next
+        self.lastHarvest = subreddit
+
+        return self.userList
+
+
+    def get_users_from_threads(self, subreddit):
+        """
+        Finds users by loading every thread in the subreddit's hot
+        list and going through its whole comment tree. It takes 1
+        argument, which is the subreddit to be scanned. Users are
+        added to self.userList.
+        """
+
+        while True:
+            try:
+                # get threads from the hot list
+                submissions = self.reader().get_subreddit(subreddit).get_hot(limit=self.scrapeLimit)
+                break
+
+            except (ConnectionResetError, HTTPError, timeout) as e:
+                self.add_msg('\n' + str(e))
+                continue
+        
+        if self.harvestWorkers > 1:
+            self.harvest_parallel(submissions)
+            return
+
+        for i, submission in enumerate(submissions):
+            if len(self.userList) > self.userLimit:
+                return
+
+            self.add_authors(self.thread_authors(submission), i)
+
+
+    def harvest_parallel(self, submissions):
+        """
+        Expands several threads' comments at once on a pool of
+        harvestWorkers threads. The authors of each thread are
+        added in the order of the hot list, so the user list comes
+        out the same as when the threads are expanded one by one.
+        Give it the listing of threads.
+        """
+
+        # futures in hot list order, kept short so threads past
+        # the userLimit mostly never get expanded
+        pending = deque()
+        merged = 0
+
+        with ThreadPoolExecutor(max_workers=self.harvestWorkers) as pool:
+            try:
+                for submission in submissions:
+                    pending.append(pool.submit(self.thread_authors, submission, True))
+
+                    if len(pending) < self.harvestWorkers * 2:
+                        continue
+
+                    self.add_authors(pending.popleft().result(), merged)
+                    merged += 1
+
+                    if len(self.userList) > self.userLimit:
+                        return
+
+                while pending:
+                    self.add_authors(pending.popleft().result(), merged)
+                    merged += 1
+
+                    if len(self.userList) > self.userLimit:
+                        return
+
+            finally:
+                for future in pending:
+                    future.cancel()
+
+
+    def thread_client(self):
+        """
+        Returns the client of the harvest thread this is called
+        on, building it the first time. Its requests go out as the
+        accounts reader() uses, through their own handlers, so the
+        threads share each account's rate limit without sharing a
+        praw.Reddit.
+        """
+
+        client = getattr(self.threadClients, "client", None)
+
+        if client is None:
+            if self.pool is None:
+                handler = PoolHandler(lambda: self.client)
+
+            else:
+                handler = PoolHandler(self.pool.next, len(self.pool.accounts))
+
+            client = praw.Reddit(user_agent=self.useragent, handler=handler, disable_update_check=True)
+            self.threadClients.client = client
+
+        return client
+
+
+    def thread_authors(self, submission, ownClient=False):
+        """
+        Loads a thread's whole comment tree and returns the thread
+        creator and the commenters whose score is above minScore,
+        in the order they're found. Users can appear more than
+        once. Give it the submission, and pass ownClient=True when
+        running on a harvest thread so the comments are loaded
+        with that thread's client.
+        """
+
+        authors = []
+
+        # the comments haven't been loaded yet, so every request
+        # for them goes through the session set here
+        if(ownClient):
+            submission.reddit_session = self.thread_client()
+
+        try:
+            submitter = str(submission.author)
+            subScore = int(submission.score)
+
+        except AttributeError:
+            return authors
+
+        # exclude submitters of posts beneath this threshold
+        if subScore > self.minScore:
+            authors.append(submitter)
+
+        while True:
+            try:
+                # load more comments
+                submission.replace_more_comments(limit=None, threshold=0)
+                break
+
+            except (ConnectionResetError, HTTPError, timeout) as e:
+                self.add_msg('\n' + str(e))
+                continue
+
+        # get the comment authors
+        for comment in self.walk_comments(submission):
+            try:
+                commenter = str(comment.author)
+                comScore = int(comment.score)
+
+            except AttributeError:
+                continue
+
+            if comScore > self.minScore:
+                authors.append(commenter)
+
+        if(self.lowMemory):
+            self.release_comments(submission)
+
+        return authors
+
+
+    def add_authors(self, authors, i):
+        """
+        Adds the authors found in a thread to self.userList, leaving
+        out users that are already there or should be skipped. Give
+        it the list of authors and the position of the thread in
+        the hot list.
+        """
+
+        for author in authors:
+            # make sure that users don't get added multiple times
+            if author not in self.userList and not self.skip_user(author):
+                self.userList.append(author)
+                print("\r{0} users found up to thread ({1} / {2}).".format(len(self.userList), i + 1, self.scrapeLimit), end='')
+
+        if(self.lowMemory):
+            self.userList.check_memory()
+
+
+    def get_users_from_listings(self, subreddit):
+        """
+        Finds users by paging through the subreddit's newest
+        comments and then its newest submissions. Each request
+        returns up to 100 authors, which takes far fewer requests
+        than expanding every hot thread. Stops once userLimit is
+        reached or the items get older than harvestWindow. It
+        takes 1 argument, which is the subreddit to be scanned.
+        Users are added to self.userList.
+        """
+
+        if self.harvestWindow > 0:
+            cutoff = time() - self.harvestWindow * 3600
+
+        else:
+            cutoff = None
+
+        for listing in ["comments", "submissions"]:
+            while True:
+                try:
+                    if listing == "comments":
+                        items = self.reader().get_subreddit(subreddit).get_comments(limit=None)
+
+                    else:
+                        items = self.reader().get_subreddit(subreddit).get_new(limit=None)
+
+                    for item in items:
+                        if len(self.userList) > self.userLimit:
+                            return
+
+                        try:
+                            author = str(item.author)
+                            score = int(item.score)
+                            created = float(item.created_utc)
+
+                        except AttributeError:
+                            continue
+
+                        # listings are newest first, so nothing
+                        # after this is inside the window either
+                        if cutoff is not None and created < cutoff:
+                            break
+
+                        if score > self.minScore:
+                            if author not in self.userList and not self.skip_user(author):
+                                self.userList.append(author)
+                                print("\r{0} users found in the {1} listing.".format(len(self.userList), listing), end='')
+
+                    break
+
+                except (ConnectionResetError, HTTPError, timeout) as e:
+                    self.add_msg('\n' + str(e))
+                    continue
+
+            if(self.lowMemory):
+                self.userList.check_memory()
+
+
+    def report_harvest(self, subreddit, userCount, requestCount, elapsed):
+        """
+        Prints how many requests finding the users took and keeps
+        a record of it in stats.db. If the other harvest mode was
+        used on the same subreddit before, it also prints how many
+        requests that mode would have needed for the same number
+        of users.
+        """
+
+        print("\nFound {0} users with {1} requests in {2:.1f} seconds.".format(userCount, requestCount, elapsed))
+
+        con = db.connect("stats.db")
+        cur = con.cursor()
+
+        cur.execute("CREATE TABLE IF NOT EXISTS harvest(Subreddit TEXT, Mode TEXT, Users INT, Requests INT, Date TEXT)")
+
+        cur.execute(
+            "SELECT Mode, Users, Requests FROM harvest WHERE Subreddit=? AND Mode!=? AND Users>0 ORDER BY rowid DESC LIMIT 1",
+            (subreddit, self.harvestMode)
+        )
+
+        for mode, users, requests in cur.fetchall():
+            # scale the old run up or down to this many users
+            estimate = int(float(requests) / users * userCount)
+
+            print("The {0} mode used {1:.2f} requests per user last time, or about {2} requests for {3} users.".format(
+                mode, float(requests) / users, estimate, userCount))
+
+        cur.execute(
+            "INSERT INTO harvest VALUES(?, ?, ?, ?, ?)",
+            (subreddit, self.harvestMode, userCount, requestCount, datetime.now().strftime("%Y-%m-%d"))
+        )
+
+        con.commit()
+        con.close()
+
+
+    def report_scan(self, userCount, cachedCount, requestCount, elapsed):
+        """
+        Keeps a record in stats.db of how many of the users were
+        already cached and how many requests and seconds scanning
+        them took, under the subreddit they were harvested from.
+        planner.py works its estimates out from these.
+        """
+
+        con = db.connect("stats.db")
+        cur = con.cursor()
+
+        cur.execute("CREATE TABLE IF NOT EXISTS scan(Subreddit TEXT, Users INT, Cached INT, Requests INT, Seconds REAL, Date TEXT)")
+
+        cur.execute(
+            "INSERT INTO scan VALUES(?, ?, ?, ?, ?, ?)",
+            (self.lastHarvest, userCount, cachedCount, requestCount, elapsed, datetime.now().strftime("%Y-%m-%d"))
+        )
+
+        con.commit()
+        con.close()
+
+
+    def walk_comments(self, submission):
+        """
+        Yields every comment in a submission's comment tree in the
+        same order as praw.helpers.flatten_tree(), but one at a
+        time instead of building the whole flattened list. Give it
+        the submission.
+        """
+
+        queue = deque(submission.comments)
+
+        while queue:
+            comment = queue.popleft()
+
+            yield comment
+
+            queue.extendleft(getattr(comment, "replies", []))
+
+
+    def release_comments(self, submission):
+        """
+        Drops the comment tree that praw keeps on a submission.
+        The listing that get_hot() pages through still holds on
+        to the submission until the next page is fetched, so
+        deleting our own reference isn't enough.
+        """
+
+        submission._comments = []
+        submission._comments_by_id = {}
+        submission._orphaned = {}
+
+
+    def get_subs(self, userList, progress=None):
+        """
+        This function uses the list collected by get_users()
+        in order to find the crossover subreddits. It takes 1
+        argument which is a list of users to scan through, and
+        optionally the ProgressivePost to keep up to date.
+        It then stores the results in a list which will be
+        put into tuples and then sorted. It returns a list of
+        subreddits.
+        """
+
+        if(self.sharding):
+            return self.get_subs_sharded(userList)
+
+        print("\nScanning for overlapping subreddits...")
+        
+
+        requestsBefore = self.handler.count
+        startTime = time()
+
+        # keeps count on overlapping users
+        self.counter = Counter()
+
+        # users per score bucket for each subreddit
+        self.histogram = defaultdict(Counter)
+
+        # keeps count on overviews cut short in adaptive mode
+        self.truncatedUsers = 0
+        self.pagesSkipped = 0
+        self.undatedUsers = 0
+
+        if not(os.path.isdir("users")):
+            os.mkdir("users")
+
+        # for the planner's estimate of cache hits
+        cachedCount = len([user for user in userList if is_cached(user)])
+
+        pool = None
+        cached = iter([])
+
+        if self.scanProcesses > 1:
+            pool = ProcessPoolExecutor(max_workers=self.scanProcesses)
+            cached = self.scan_cached_users(pool, userList)
+
+        try:
+            nextCached = next(cached, None)
+
+            # iterate through the list of users in order
+            # to get their comments/submissions for crossreferencing
+            for i, user in enumerate(userList):
+                # keeps track of how many users are remaining
+                usersLeft = len(userList) - i - 1
+
+                # cached users come back from the pool in the same
+                # order, so they're tallied in the usual order
+                if nextCached is not None and operator.getitem(nextCached, 0) == user:
+                    userSubs = operator.getitem(nextCached, 1)
+                    nextCached = next(cached, None)
+
+                    if userSubs is None:
+                        userSubs = self.scan_user(user)
+
+                else:
+                    userSubs = self.scan_user(user)
+
+                if userSubs is not None:
+                    print("\r({0} / {1}) users remaining.".format(usersLeft, len(userList)), end='')
+
+                    self.tally_user(userSubs)
+
+                if progress is not None:
+                    progress.update(i + 1, len(userList))
+
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        if(self.adaptiveDepth):
+            print("\n{0} overviews were cut short, saving up to {1} requests.".format(self.truncatedUsers, self.pagesSkipped))
+
+        if self.undatedUsers > 0:
+            print("\n{0} users have items with no date, which are left out of the {1} day window.".format(self.undatedUsers, self.window))
+
+        print("\nScanned {0} users with {1} requests in {2:.1f} seconds.".format(
+            len(userList), self.handler.count - requestsBefore, time() - startTime))
+
+        self.report_scan(len(userList), cachedCount, self.handler.count - requestsBefore, time() - startTime)
+
+        return self.subredditList
+
+
+    def start_progress(self, subreddit):
+        """
+        Sets up a ProgressivePost for a drilldown if progressive
+        publishing is on. Give it the subreddit. Returns the
+        ProgressivePost to pass to get_subs(), or None.
+        """
+
+        if not(self.progressive) or self.sharding:
+            return None
+
+        return ProgressivePost(
+            lambda text: self.submit_post(subreddit, text, self.running_overlaps(subreddit)),
+            lambda post, text: post.edit(text),
+            lambda scanned, total: self.partial_drilldown(subreddit, scanned, total),
+            self.firstPost,
+            self.editInterval,
+            self.topK,
+            self.topChange,
+            self.maxEdits
+        )
+
+
+    def running_overlaps(self, subreddit):
+        """
+        Returns the subreddits that would make it into the drilldown
+        if the crawl stopped now, picked the same way as
+        create_tuples() picks them.
+        """
+
+        return [
+            sub for sub in self.subredditList
+            if sub.lower() != subreddit.lower() and self.counter[sub] >= 5
+        ]
+
+
+    def partial_drilldown(self, subreddit, scanned, total):
+        """
+        Formats the running tallies of get_subs() as a post with a
+        banner saying how far the scan got. Give it the subreddit,
+        the number of users scanned and the number of users in the
+        drilldown. Returns the text and the overlapping subreddits
+        from most to fewest users.
+        """
+
+        ranking = self.running_overlaps(subreddit)
+
+        ranking.sort(key=lambda sub: self.counter[sub], reverse=True)
+
+        rows = [(subreddit, scanned)] + [(sub, self.counter[sub]) for sub in ranking]
+
+        text = "**Partial results, {0} of {1} users scanned. This post is updated as the crawl goes on.**\n\n".format(scanned, total)
+        text += format_drilldown(subreddit, scanned, rows, self.banList, window=self.window)
+
+        return (text, [sub for sub in ranking if sub not in self.banList])
+
+
+    def scan_cached_users(self, pool, userList):
+        """
+        Reads the users that are already cached on a pool of
+        processes, in batches of scanBatchSize, while the users
+        that aren't get crawled. Give it the pool and the list of
+        users. Yields (user, result of read_cached()) in the order
+        of userList.
+        """
+
+        users = [user for user in userList if is_cached(user) and not self.skip_user(user)]
+
+        jobs = []
+
+        for start in range(0, len(users), self.scanBatchSize):
+            jobs.append((
+                users[start:start + self.scanBatchSize],
+                self.minScore,
+                self.window,
+                self.overviewLimit,
+                not(self.adaptiveDepth)
+            ))
+
+        batches = pool.map(scan_cached, jobs)
+
+        for job, results in zip(jobs, batches):
+            for user, userSubs in zip(operator.getitem(job, 0), results):
+                yield (user, userSubs)
+
+
+    def tally_user(self, userSubs):
+        """
+        Adds one user's subreddits to the running tally. Give it
+        the list returned by scan_user(). Each subreddit is only
+        counted once per user, and only if the user's best score
+        there is above the minimum. Every subreddit also goes into
+        the score histogram so other minimums can be worked out
+        later without a recrawl.
+        """
+
+        for csubreddit, maxScore in userSubs:
+            bucket = bucket_of(maxScore, self.scoreBuckets)
+
+            if bucket is not None:
+                self.histogram[csubreddit][bucket] += 1
+
+            if maxScore > self.minScore:
+                # keep tabs on how many
+                # users post to a subreddit
+                self.counter[csubreddit] += 1
+
+                # the first user counted in a subreddit adds
+                # it to the list, without searching the list
+                if self.counter[csubreddit] == 1:
+                    self.subredditList.append(csubreddit)
+
+
+    def scan_user(self, user):
+        """
+        Collects the subreddits that a single user has posted to,
+        either from Reddit or from the user's cached database file.
+        It takes 1 argument which is the name of the user. It
+        returns a list of (subreddit, best score) pairs in the
+        order they were found, or None if the user should be
+        skipped.
+        """
+
+        if(self.skip_user(user)):
+            return None
+
+        dbFile = "{0}.db".format(user)
+
+        # keeps track of user subs and their best scores
+        # to prevent multiple posts from being tallied
+        self.userScores = OrderedDict()
+
+        if not(os.path.isfile("users/{0}".format(dbFile))):
+            overview = self.request_overview(user, self.overviewLimit)
+
+            if overview is None:
+                return None
+
+            con = db.connect("users/{0}".format(dbFile))
+            cur = con.cursor()
+
+            cur.execute("CREATE TABLE IF NOT EXISTS user(Overlap TEXT, Type TEXT, ID TEXT, Score INT, Created REAL)")
+
+            ensure_aggregate(cur, self.minScore)
+            ensure_created(cur)
+
+            # a bot's file isn't worth keeping
+            if(self.read_overview(cur, overview, 0)):
+                con.close()
+                os.remove("users/{0}".format(dbFile))
+                self.registry.record(user, "bot")
+                return None
+
+            con.commit()
+
+            # in the order the subreddits qualified, not the order
+            # their first items came in
+            self.userScores = read_scores(cur, self.minScore, self.window)
+
+            con.close()
+
+        else:
+            con = db.connect("users/{0}".format(dbFile))
+            cur = con.cursor()
+
+            try:
+                ensure_aggregate(cur, self.minScore)
+                ensure_created(cur)
+                con.commit()
+
+                self.userScores = read_scores(cur, self.minScore)
+
+            except OperationalError as e:
+                con.close()
+                os.remove("users/{0}".format(dbFile))
+                return None
+
+            # an earlier adaptive scan stopped short, so carry
+            # on from there now that the full depth is wanted
+            if not(self.adaptiveDepth):
+                after, depth = get_truncation(cur)
+
+                if after is not None and depth < self.overviewLimit:
+                    overview = self.request_overview(user, self.overviewLimit - depth, after)
+
+                    if overview is not None:
+                        self.read_overview(cur, overview, depth)
+                        con.commit()
 
-        # list of overlapping subreddits
-        self.subredditList = []
+                        self.userScores = read_scores(cur, self.minScore)
 
-        if(self.config.main.getboolean("banList")):
-            with open("banlist.txt", 'r') as f:
-                for subreddit in f.readlines():
-                    subreddit = subreddit.strip('\n')
-                    self.banList.append(subreddit)
+            if self.window > 0:
+                # items cached before dates were kept would drop
+                # out of the window without a word
+                if(needs_dates(cur)):
+                    self.backfill_dates(user, cur)
+                    con.commit()
 
-    
-    def add_msg(self, msg=None, newline=False):
-        """
-        Simple function to make terminal output optional. Feed
-        it the message to print out. Can also tell it to print a 
-        newline if you want to.
-        """
+                if count_undated(cur) > 0:
+                    self.undatedUsers += 1
 
-        if(self.verbose):
-            if msg is not None:
-                print(msg)
+                self.userScores = read_scores(cur, self.minScore, self.window)
 
-            if(newline):
-                print('\n')
+            con.close()
 
+        return list(self.userScores.items())
 
-    def login(self, username, password):
+
+    def backfill_dates(self, user, cur):
         """
-        This function logs the bot into its Reddit account.
-        It takes 2 arguments: the username and the password.
+        Fills in the dates of a user's items that were stored
+        before dates were kept, from a fresh copy of their overview.
+        Items that are gone from the overview stay undated and are
+        left out of windowed drilldowns. The file is marked so it
+        only gets backfilled once. Give it the name of the user and
+        the cursor of their database file.
         """
 
-        self.client = praw.Reddit(user_agent=self.useragent)
-        print("Logging in as {0}...".format(username))
-        
+        overview = self.request_overview(user, self.fullOverviewLimit)
 
-        self.client.login(username, password)
-        print("Login successful.")
+        if overview is not None:
+            try:
+                for item in overview:
+                    try:
+                        cur.execute(
+                            "UPDATE user SET Created=? WHERE ID=? AND Created IS NULL",
+                            (float(item.created_utc), str(item.id))
+                        )
 
+                    except AttributeError:
+                        continue
 
-    def get_users(self, subreddit):
+            except (ConnectionResetError, HTTPError, timeout) as e:
+                self.add_msg('\n' + str(e))
+
+        cur.execute("CREATE TABLE IF NOT EXISTS meta(Key TEXT PRIMARY KEY, Value TEXT)")
+        cur.execute("INSERT OR REPLACE INTO meta VALUES('dated', '1')")
+
+
+    def request_overview(self, user, limit, after=None):
         """
-        This function creates a list of users that posted in
-        the subreddit which is being scanned. The data from these
-        users is then collected to determine where else they post.
-        It takes 1 argument, which is the subreddit to be scanned.
-        It returns a list of users.
+        Asks Reddit for a user's overview and loads its first page.
+        Give it the name of the user, how many items to get and
+        optionally the fullname of the item to continue after.
+        Returns the overview, or None if the account is gone, in
+        which case its status goes into the registry. Reddit
+        answers 404 for deleted and shadowbanned accounts alike, so
+        both are recorded as "shadowbanned".
         """
 
-        print("Getting users for /r/{0}...".format(subreddit))
+        if after is None:
+            params = {}
+
+        else:
+            params = {"after": after}
 
         while True:
             try:
-                # get threads from the hot list
-                submissions = self.client.get_subreddit(subreddit).get_hot(limit=self.scrapeLimit)
-                break
+                overview = self.reader().get_redditor(user).get_overview(limit=limit, params=params)
+
+                # the overview is only fetched once it's iterated, so
+                # load the first page now to see if the account is
+                # still around
+                first = next(overview, None)
+
+            # handle shadowbanned/deleted accounts
+            except NotFound:
+                self.registry.record(user, "shadowbanned")
+                return None
+
+            # suspended accounts are forbidden
+            # instead of missing
+            except Forbidden:
+                self.registry.record(user, "suspended")
+                return None
 
             except (ConnectionResetError, HTTPError, timeout) as e:
                 self.add_msg('\n' + str(e))
                 continue
-        
-        # get the thread creator and if he's not
-        # in the userList then add him there
-        for i, submission in enumerate(submissions):
-            if len(self.userList) > self.userLimit:
-                return self.userList
 
-            try:
-                submitter = str(submission.author)
-                subScore = int(submission.score)
+            if first is None:
+                return iter([])
 
-            except AttributeError:
-                continue
+            return chain([first], overview)
 
-            # exclude submitters of posts beneath this threshold
-            if subScore > self.minScore:
-                # make sure that users don't get added multiple times
-                if submitter not in self.userList:
-                    self.userList.append(submitter)
-                    print("\r{0} users found up to thread ({1} / {2}).".format(len(self.userList), i + 1, self.scrapeLimit), end='')
 
+    def read_overview(self, cur, overview, depth):
+        """
+        Stores the items of a user's overview in their database
+        file and keeps the best score of each subreddit in
+        self.userScores. In adaptive mode it stops once several pages
+        in a row turn up nothing new and marks the file as
+        truncated so a deeper scan can continue later. Give it the
+        cursor of the user's database file, the overview and how
+        many items are already stored. Returns True if the first
+        page of a new overview was posted too fast for a person,
+        in which case it stops there.
+        """
 
-            while True:
-                try:
-                    # load more comments
-                    submission.replace_more_comments(limit=None, threshold=0)
-                    break
+        if(self.adaptiveDepth):
+            tracker = OverviewDepth(self.stalePages, self.minPages)
 
-                except (ConnectionResetError, HTTPError, timeout) as e:
-                    self.add_msg('\n' + str(e))
-                    continue
+        else:
+            tracker = OverviewDepth(0, 0)
 
-            # get the comment authors and append
-            # them to userList for scanning
-            for comment in praw.helpers.flatten_tree(submission.comments):
-                try:
-                    commenter = str(comment.author)
-                    comScore = int(comment.score)
+        tracker.seen.update(sub for sub, score in self.userScores.items() if score > self.minScore)
 
-                except AttributeError:
-                    continue
+        lastItem = None
+        stopped = False
 
-                if comScore > self.minScore:
-                    if commenter not in self.userList:
-                        self.userList.append(commenter)
-                        print("\r{0} users found up to thread ({1} / {2}).".format(len(self.userList), i + 1, self.scrapeLimit), end='')
+        # when the items on the first page were posted
+        pageDates = []
+        isBot = False
 
-        return self.userList
+        while True:
+            try:
+                for submission in overview:
 
+                    try:
+                        csubreddit = str(submission.subreddit)
+                        comScore = int(submission.score)
+                        comID = str(submission.id)
 
-    def get_subs(self, userList):
-        """
-        This function uses the list collected by get_users()
-        in order to find the crossover subreddits. It takes 1
-        argument which is a list of users to scan through.
-        It then stores the results in a list which will be
-        put into tuples and then sorted. It returns a list of
-        subreddits.
-        """
+                    except AttributeError:
+                        continue
 
-        print("\nScanning for overlapping subreddits...")
-        
+                    try:
+                        created = float(submission.created_utc)
 
-        # keeps count on overlapping users
-        self.counter = Counter()
+                    except AttributeError:
+                        created = None
 
-        if not(os.path.isdir("users")):
-            os.mkdir("users")
+                    try:
+                        testIfSubmission = str(submission.stickied)
+                        submissionType = "submission"
 
-        # iterate through the list of users in order
-        # to get their comments/submissions for crossreferencing
-        for i, user in enumerate(userList):
-            shadowbanned = False
+                    except AttributeError:
+                        submissionType = "comment"
 
-            dbFile = "{0}.db".format(user)
-            
-            if not(os.path.isfile("users/{0}".format(dbFile))):
-                while True:
                     try:
-                        overview = self.client.get_redditor(user).get_overview(limit=self.overviewLimit)
-                        break
-                    # handle shadowbanned/deleted accounts
-                    except (ConnectionResetError, HTTPError, timeout) as e:
-                        if "404" in str(e):
-                            shadowbanned = True
+                        cur.execute("INSERT INTO user VALUES(?, ?, ?, ?, ?)", (csubreddit, submissionType, comID, comScore, created))
+                        self.update_aggregate(cur, csubreddit, comScore, cur.lastrowid)
+
+                    except OperationalError as e:
+                        pass
+
+                    lastItem = submission.fullname
+
+                    if depth == 0 and created is not None and len(pageDates) < PAGE_SIZE:
+                        pageDates.append(created)
+
+                        if len(pageDates) == PAGE_SIZE and self.is_bot(pageDates):
+                            isBot = True
                             break
 
-                        else:
-                            self.add_msg('\n' + str(e))
-                            continue
+                    if csubreddit not in self.userScores or comScore > self.userScores[csubreddit]:
+                        self.userScores[csubreddit] = comScore
 
-                if(shadowbanned):
-                    continue
+                    if(tracker.add(csubreddit, comScore > self.minScore)):
+                        stopped = True
+                        break
 
-                con = db.connect("users/{0}".format(dbFile))
-                cur = con.cursor()
+                break
 
-                cur.execute("CREATE TABLE IF NOT EXISTS user(Overlap TEXT, Type TEXT, ID TEXT, Score INT)")
+            except (ConnectionResetError, HTTPError, timeout) as e:
+                self.add_msg('\n' + str(e))
+                continue
 
-                # keeps track of user subs to prevent multiple
-                # posts from being tallied
-                self.userDone = []
+        if(isBot):
+            return True
 
-                # keeps track of how many users are remaining
-                usersLeft = len(userList) - i - 1
+        depth += tracker.items
 
-                print("\r({0} / {1}) users remaining.".format(usersLeft, len(userList)), end='')
+        cur.execute("CREATE TABLE IF NOT EXISTS meta(Key TEXT PRIMARY KEY, Value TEXT)")
 
-                while True:
-                    try:
-                        for submission in overview:
+        # a reduced counterpart scan that used up its smaller limit
+        # is truncated too, so a full drilldown carries on from it
+        reducedStop = depth >= self.overviewLimit and lastItem is not None
 
-                            try:
-                                csubreddit = str(submission.subreddit)
-                                comScore = int(submission.score)
-                                comID = str(submission.id)
+        if((stopped) or (reducedStop)) and depth < self.fullOverviewLimit:
+            cur.execute("INSERT OR REPLACE INTO meta VALUES('after', ?)", (lastItem,))
+            cur.execute("INSERT OR REPLACE INTO meta VALUES('depth', ?)", (str(depth),))
 
-                            except AttributeError:
-                                continue
+            if(stopped):
+                self.truncatedUsers += 1
+                self.pagesSkipped += (self.overviewLimit - depth) // PAGE_SIZE
 
-                            try:
-                                testIfSubmission = str(submission.stickied)
-                                submissionType = "submission"
+        else:
+            cur.execute("DELETE FROM meta WHERE Key IN ('after', 'depth')")
 
-                            except AttributeError:
-                                submissionType = "comment"
+        return False
 
-                            try:
-                                cur.execute("INSERT INTO user VALUES(?, ?, ?, ?)", (csubreddit, submissionType, comID, comScore))
 
-                            except OperationalError as e:
-                                pass
+    def is_bot(self, dates):
+        """
+        Checks whether a page of overview items came out faster
+        than botRate items a day. Give it the times the items were
+        posted.
+        """
 
-                            if comScore > self.minScore:
-                                if csubreddit not in self.userDone:
-                                    # keep tabs on how many
-                                    # users post to a subreddit
-                                    self.counter[csubreddit] += 1
-                                    self.userDone.append(csubreddit)
+        if self.botRate <= 0:
+            return False
 
-                                # add the ones that aren't kept in the list
-                                # to the list of subreddits
-                                if csubreddit not in self.subredditList:
-                                    self.subredditList.append(csubreddit)
+        days = (max(dates) - min(dates)) / 86400.0
 
-                        break
+        return len(dates) > self.botRate * days
 
-                    except (ConnectionResetError, HTTPError, timeout) as e:
-                        self.add_msg('\n' + str(e))
-                        continue
 
-                con.commit()
-                con.close()
+    def update_aggregate(self, cur, csubreddit, comScore, rowID):
+        """
+        Adds a newly stored item to the aggregate table. Give it the
+        cursor of the user's file, the item's subreddit, its score
+        and the row it was stored in.
+        """
 
-            else:
-                
-                # keeps track of user subs to prevent multiple
-                # posts from being tallied
-                self.userDone = []
+        cur.execute("INSERT OR IGNORE INTO aggregate VALUES(?, 0, ?, ?, NULL)", (csubreddit, comScore, rowID))
+        cur.execute(
+            "UPDATE aggregate SET Items=Items+1, MaxScore=MAX(MaxScore, ?), "
+            "Qualified=COALESCE(Qualified, CASE WHEN ?>? THEN ? END) WHERE Overlap=?",
+            (comScore, comScore, self.minScore, rowID, csubreddit)
+        )
 
-                # keeps track of how many users are remaining
-                usersLeft = len(userList) - i - 1
 
-                print("\r({0} / {1}) users remaining.".format(usersLeft, len(userList)), end='')
+    def get_subs_sharded(self, userList):
+        """
+        Does the same job as get_subs(), but spreads the users
+        across the shared work queue so that worker processes on
+        this or other machines can scan them too. This process
+        works through the queue alongside them, waits for the
+        rest of the leases to finish and then merges every
+        worker's results in the order of userList. Users the
+        queue gave up on are removed from userList, so they don't
+        count towards the total. It takes 1 argument which is the
+        list of users to scan through. It returns a list of
+        subreddits.
+        """
+
+        print("\nScanning for overlapping subreddits across {0} shards...".format(self.shards))
+        
 
-                con = db.connect("users/{0}".format(dbFile))
-                cur = con.cursor()
+        self.counter = Counter()
+        self.histogram = defaultdict(Counter)
 
-                try:
-                    cur.execute("SELECT * FROM user")
+        self.truncatedUsers = 0
+        self.pagesSkipped = 0
+        self.undatedUsers = 0
 
-                except OperationalError as e:
-                    con.close()
-                    os.remove("users/{0}".format(dbFile))
-                    continue
+        if not(os.path.isdir("users")):
+            os.mkdir("users")
 
-                for row in cur:
-                    csubreddit = operator.getitem(row, 0)
-                    comScore = int(operator.getitem(row, 3))
+        queue = WorkQueue(self.queueFile, self.shards, self.leaseTime, self.maxAttempts)
 
-                    if comScore > self.minScore:
-                        if csubreddit not in self.userDone:
-                            self.counter[csubreddit] += 1
-                            self.userDone.append(csubreddit)
+        job = queue.create_job(userList)
 
-                        if csubreddit not in self.subredditList:
-                            self.subredditList.append(csubreddit)
+        # work on the queue like any other worker until
+        # nothing is left to lease
+        self.run_worker(queue, job, "coordinator-{0}".format(os.getpid()))
 
-                con.close()
+        while True:
+            remaining = queue.remaining(job)
+
+            if remaining == 0:
+                break
+
+            print("\r({0} / {1}) users remaining.".format(remaining, len(userList)), end='')
+
+            # pick up leases that crashed workers left behind
+            self.run_worker(queue, job, "coordinator-{0}".format(os.getpid()))
+            sleep(self.pollInterval)
+
+        for userSubs in queue.results(job):
+            if userSubs is None:
+                continue
+
+            self.tally_user(userSubs)
+
+        # users that were never scanned don't count towards
+        # the drilldown's total
+        dropped = queue.dropped(job)
+
+        if len(dropped) > 0:
+            print("\n{0} users were dropped after {1} attempts.".format(len(dropped), self.maxAttempts))
+
+            for user in dropped:
+                userList.remove(user)
+
+        queue.close_job(job)
+        queue.close()
 
         return self.subredditList
 
 
+    def run_worker(self, queue, job, workerName, shard=None):
+        """
+        Leases batches of users from the work queue, scans them
+        and stores the results back in the queue. Give it the
+        queue, the job number, a name for this worker and
+        optionally the shard to stick to. Returns once there is
+        nothing left to lease.
+        """
+
+        while True:
+            batch = queue.lease(job, workerName, self.batchSize, shard)
+
+            if len(batch) == 0:
+                return
+
+            for user in batch:
+                userSubs = self.scan_user(user)
+
+                # the lease ran out and the user went to another worker
+                if not(queue.complete(job, user, workerName, userSubs)):
+                    self.add_msg("\nLease on {0} expired before the scan finished.".format(user))
+
+                print("\r({0} / {1}) users remaining.".format(queue.remaining(job), queue.size(job)), end='')
+
+
     def create_tuples(self, subreddit, subredditList):
         """
         This function takes 2 arguments, the first which
@@ -363,14 +1470,16 @@ class SubredditAnalysis(object):
         return self.subredditTuple
 
 
-    def add_db(self, subreddit, subredditTuple, userCount):
+    def add_db(self, subreddit, subredditTuple, userCount, fidelity="full"):
         """
         Iterates through a list of tuples which contain the name 
         of a subreddit and the amount of overlapping users. It takes 
         two arguments. The first is the subreddit which drilldown this 
         is for. The second is the collected list of tuples which 
         contain the overlapping subreddits and the amount of 
-        overlapping users.
+        overlapping users. The drilldown is tagged with its fidelity,
+        "full" or "reduced", and a full drilldown replaces a reduced
+        one that's already stored.
         """
 
         print("Adding data to database...")
@@ -378,15 +1487,22 @@ class SubredditAnalysis(object):
         if not(os.path.isdir("subreddits")):
             os.mkdir("subreddits")
 
-        dbFile = "{0}.db".format(subreddit)
+        # history and the index only follow all-time drilldowns
+        if fidelity == "full" and self.window == 0:
+            self.add_history(subreddit, subredditTuple, userCount)
+
+        dbFile = drilldown_path(subreddit, self.window)
 
-        if(os.path.isfile("subreddits/{0}".format(dbFile))):
+        if fidelity == "full" and read_fidelity(subreddit, self.window) == "reduced":
+            os.remove(dbFile)
+
+        if(os.path.isfile(dbFile)):
             pass
 
         else:
 
             # connect to the database file
-            con = db.connect("subreddits/{0}".format(dbFile))
+            con = db.connect(dbFile)
         
             # create the cursor object for the database
             cur = con.cursor()
@@ -403,187 +1519,155 @@ class SubredditAnalysis(object):
 
                 cur.execute("INSERT INTO drilldown VALUES(?, ?)", (subName, users))
 
+            write_histogram(cur, self.histogram, self.scoreBuckets)
+
+            cur.execute("CREATE TABLE IF NOT EXISTS meta(key TEXT PRIMARY KEY, value TEXT)")
+            cur.execute("INSERT OR REPLACE INTO meta VALUES('fidelity', ?)", (fidelity,))
+
             con.commit()
             con.close()
 
+            if(self.indexing) and self.window == 0:
+                self.update_index(subreddit)
 
-    def calculate_similarity(self, subreddit1, subreddit2):
+
+    def add_history(self, subreddit, subredditTuple, userCount):
         """
-        Calculates the similarity between two subreddits. Give it the
-        two subreddits to compare. Returns the similarity as a tuple 
-        with subreddit2 as the first element and the similarity as 
-        the second element.
+        Keeps a dated snapshot of every drilldown, even when
+        subreddits/ already has one for the subreddit. Takes the
+        same arguments as add_db().
         """
 
-        print("Calculating similarity...")
-        
-
-        # format the file names
-        dbFile1 = "{0}.db".format(subreddit1)
-        dbFile2 = "{0}.db".format(subreddit2)
-
-        # so these are defined in case that sub1 or sub2 don't 
-        # show up in the drilldown for one of them they can be
-        # set equal to each other so the program can calculate the
-        # similarity between the 2 subreddits.
-        AB = None
-        BA = None
-
-        # if a drilldown for this subreddit hasn't been done then do it
-        if(os.path.isfile("subreddits/{0}".format(dbFile1)) == False):
-            while True:
-                # get the list of users
-                try:
-                    userList = self.get_users(subreddit1)
-                    self.userList = []
-                    break
-
-                except (InvalidSubreddit, RedirectException) as e:
-                    self.add_msg(e)
-                    logging.error(str(e) + "\n\n")
-                    raise SkipThis("Skipping invalid subreddit...")
-
-                except (APIException, ClientException, Exception) as e:
-                    self.add_msg(e)
-                    logging.error(str(e) + "\n\n")
-                    raise SkipThis("Couldn't get users. Skipping...")
-        
-            while True:
-                try:
-                    # get the list of subreddits
-                    subredditList = self.get_subs(userList)
-                    self.subredditList = []
-                    break
+        params = {
+            "scrapeLimit": self.scrapeLimit,
+            "overviewLimit": self.overviewLimit,
+            "minScore": self.minScore,
+            "userLimit": self.userLimit,
+            "harvestMode": self.harvestMode,
+            "adaptiveDepth": self.adaptiveDepth
+        }
 
-                except (APIException, ClientException, OperationalError) as e:
-                        self.add_msg(e)
-                        logging.error(str(e) + "\n\n")
-                        raise SkipThis("Couldn't get overlapping subreddits. Skipping...")
+        history = DrilldownHistory(subreddit, self.historyDir)
+        history.add(subredditTuple, userCount, params)
+        history.close()
 
-                try:
-                    # get the list of tuples
-                    subredditTuple = self.create_tuples(subreddit1, subredditList)
 
-                except Exception as e:
-                    self.add_msg(e)
-                    logging.error("Failed to create tuples. " + str(e) + "\n\n")
-                    raise SkipThis("Failed to create tuples. Skipping...")
+    def update_index(self, subreddit):
+        """
+        Adds a newly stored drilldown to the similarity index.
+        Give it the subreddit the drilldown is for.
+        """
 
-                try:
-                    self.add_db(subreddit1, subredditTuple, len(userList))
+        try:
+            index = SimilarityIndex(self.config.index.indexFile, int(self.config.index.dims))
 
-                except Exception as e:
-                    self.add_msg(e)
-                    logging.error("Failed to add to database. " + str(e) + "\n\n")
-                    raise SkipThis("Failed to add data to database. Skipping...")
+        except ImportError as e:
+            self.add_msg(e)
+            return
 
-        if(os.path.isfile("subreddits/{0}".format(dbFile2)) == False):
-            if subreddit2 not in self.banList:
-                while True:
-                    # get the list of users
-                    try:
-                        userList = self.get_users(subreddit2)
-                        self.userList = []
-                        break
+        # only this drilldown's row gets written
+        if(index.add(subreddit)):
+            index.save()
 
-                    except (InvalidSubreddit, RedirectException) as e:
-                        self.add_msg(e)
-                        logging.error(str(e) + "\n\n")
-                        raise SkipThis("Skipping invalid subreddit...")
-
-                    except (APIException, ClientException, Exception) as e:
-                        self.add_msg(e)
-                        logging.error(str(e) + "\n\n")
-                        raise SkipThis("Couldn't get users. Skipping...")
-            
-                while True:
-                    try:
-                        # get the list of subreddits
-                        subredditList = self.get_subs(userList)
-                        self.subredditList = []
-                        break
+        index.close()
 
-                    except (APIException, ClientException, OperationalError) as e:
-                        self.add_msg(e)
-                        logging.error(str(e) + "\n\n")
-                        raise SkipThis("Couldn't get overlapping subreddits. Skipping...")
 
-                try:
-                    # get the list of tuples
-                    subredditTuple = self.create_tuples(subreddit2, subredditList)
+    def drill(self, subreddit, reduced=False):
+        """
+        Runs a whole drilldown for a subreddit and stores it. Give
+        it the subreddit and whether to use the smaller counterpart
+        budget instead of the usual limits. Raises SkipThis if the
+        drilldown can't be done.
+        """
 
-                except Exception as e:
-                    self.add_msg(e)
-                    logging.error("Failed to create tuples. " + str(e) + "\n\n")
-                    raise SkipThis("Failed to create tuples. Skipping...")
+        if(reduced):
+            limits = (self.scrapeLimit, self.overviewLimit, self.userLimit)
 
-                try:
-                    self.add_db(subreddit2, subredditTuple, len(userList))
+            self.scrapeLimit = self.counterpartScrapeLimit
+            self.overviewLimit = self.counterpartOverviewLimit
+            self.userLimit = self.counterpartUserLimit
 
-                except Exception as e:
-                    self.add_msg(e)
-                    logging.error("Failed to add to database. " + str(e) + "\n\n")
-                    raise SkipThis("Failed to add data to database. Skipping...")
+            fidelity = "reduced"
 
-            else:
-                raise SkipThis("Subreddit in banlist. Skipping...")
+        else:
+            fidelity = "full"
 
-        # Query statements need strings fed in tuples
-        sub1 = (subreddit1,)
-        sub2 = (subreddit2,)
+        try:
+            # get the list of users
+            try:
+                userList = self.get_users(subreddit)
+                self.userList = []
 
-        # open the database for subreddit 1
-        con1 = db.connect("subreddits/{0}".format(dbFile1))
-        cur1 = con1.cursor()
+            except (InvalidSubreddit, RedirectException) as e:
+                self.add_msg(e)
+                logging.error(str(e) + "\n\n")
+                raise SkipThis("Skipping invalid subreddit...")
 
-        # get the number of overlapping users from subreddit2
-        cur1.execute("SELECT users FROM drilldown WHERE overlaps=?", sub2)
+            except (APIException, ClientException, Exception) as e:
+                self.add_msg(e)
+                logging.error(str(e) + "\n\n")
+                raise SkipThis("Couldn't get users. Skipping...")
 
-        for overlap in cur1:
-            AB = operator.getitem(overlap, 0)
+            try:
+                # get the list of subreddits
+                subredditList = self.get_subs(userList)
+                self.subredditList = []
 
-        # get the total number of users found in subreddit2
-        cur1.execute("SELECT users FROM drilldown WHERE overlaps=?", sub1)
+            except (APIException, ClientException, OperationalError) as e:
+                self.add_msg(e)
+                logging.error(str(e) + "\n\n")
+                raise SkipThis("Couldn't get overlapping subreddits. Skipping...")
 
-        for userCount in cur1:
-            A = operator.getitem(userCount, 0)
+            try:
+                # get the list of tuples
+                subredditTuple = self.create_tuples(subreddit, subredditList)
 
-        # close subreddit1's database file
-        con1.close()
+            except Exception as e:
+                self.add_msg(e)
+                logging.error("Failed to create tuples. " + str(e) + "\n\n")
+                raise SkipThis("Failed to create tuples. Skipping...")
 
-        # open the database for subreddit2
-        con2 = db.connect("subreddits/{0}".format(dbFile2))
-        cur2 = con2.cursor()
+            try:
+                self.add_db(subreddit, subredditTuple, len(userList), fidelity)
 
-        # do the same thing for subreddit1 and was done for subreddit2
-        cur2.execute("SELECT users FROM drilldown WHERE overlaps=?", sub1)
+            except Exception as e:
+                self.add_msg(e)
+                logging.error("Failed to add to database. " + str(e) + "\n\n")
+                raise SkipThis("Failed to add data to database. Skipping...")
 
-        for overlap in cur2:
-            BA = operator.getitem(overlap, 0)
+        finally:
+            if(reduced):
+                self.scrapeLimit, self.overviewLimit, self.userLimit = limits
 
-        if AB is None:
-            AB = BA
 
-        if BA is None:
-            BA = AB
+    def calculate_similarity(self, subreddit1, subreddit2):
+        """
+        Calculates the similarity between two subreddits. Give it the
+        two subreddits to compare. Returns the similarity as a tuple 
+        with subreddit2 as the first element and the similarity as 
+        the second element.
+        """
 
-        cur2.execute("SELECT users FROM drilldown WHERE overlaps=?", sub2)
+        print("Calculating similarity...")
+        
 
-        for userCount in cur2:
-            B = operator.getitem(userCount, 0)
+        # if a drilldown for this subreddit hasn't been done then do it
+        if(read_fidelity(subreddit1, self.window) != "full"):
+            self.drill(subreddit1)
 
-        con2.close()
+        if(read_fidelity(subreddit2, self.window) is None):
+            if subreddit2 not in self.banList:
+                # counterparts get a smaller budget in tiered mode
+                self.drill(subreddit2, reduced=self.tieredSimilarity)
 
-        try:
-            # use the retrieved data to calculate similarity
-            similarity = float("{0:.05f}".format((sqrt(AB * BA)) / (sqrt(float(A * B)))))
+            else:
+                raise SkipThis("Subreddit in banlist. Skipping...")
 
-        except ZeroDivisionError:
-            similarity = float(0.00000)
+        similarity = similarity_from_cache(subreddit1, subreddit2, self.window)
 
-        except UnboundLocalError:
+        if similarity is None:
             raise SkipThis("Couldn't calculate similarity for this subreddit. Skipping...")
-        
+
         return (subreddit2, similarity)
 
 
@@ -600,88 +1684,49 @@ class SubredditAnalysis(object):
         print("Formatting post...")
         
 
-        # similarity values will be stored here for sorting
-        self.simList = []
-
-        dbFile = "{0}.db".format(subreddit)
+        userCount, rows = read_drilldown(subreddit, self.window)
 
-        con = db.connect("subreddits/{0}".format(dbFile))
-        cur = con.cursor()
-
-        self.bodyContent = ""
+        # similarity values will be stored here for sorting
+        self.simList = None
 
-        # make a table
-        self.bodyStart = "## /r/{0} Drilldown\n\n".format(subreddit)
-        
         if(self.similarity):
-            self.bodyStart += "| Subreddit | Similarity |\n"
-            self.bodyStart += "|:------|------:|\n"
+            self.simList = collect_similarities(
+                subreddit, rows, self.banList, self.similarityLimit, self.try_similarity
+            )
 
-            cur.execute("SELECT * FROM drilldown")
-
-            for row in cur:
-                subreddit2 = operator.getitem(row, 0)
-
-                if subreddit2 == subreddit:
-                    continue
-
-                if subreddit2 not in self.banList:
-
-                    if len(self.simList) == self.similarityLimit:
-                        break
-
-                    try:
-                        similarity = self.calculate_similarity(subreddit, subreddit2)
-                        self.simList.append(similarity)
-
-                    except SkipThis:
-                        continue
-
-            self.simList.sort(key=operator.itemgetter(1), reverse=True)
-
-            # fill in the table
-            for element in self.simList:
-                sub = operator.getitem(element, 0)
-                sim = operator.getitem(element, 1)
-                self.bodyContent += "|/r/{0}|{1}|\n".format(sub, sim)
-
-                if len(self.bodyStart + self.bodyContent) >= 1000:
-                    break
-
-        if type(userList) == list:
+        if not isinstance(userList, int):
             userList = len(userList)
 
-        self.bodyContent += "\nOf {0} Users Found:\n\n".format(userList)
-        self.bodyContent += "| Subreddit | Overlapping users |\n"
-        self.bodyContent += "|:------|------:|\n"
-
-        cur.execute("SELECT * FROM drilldown")
+        # similarities worked out from reduced counterparts get marked
+        reduced = []
 
-        for row in cur:
-            sub = operator.getitem(row, 0)
+        if self.simList is not None:
+            reduced = [sub for sub, sim in self.simList if read_fidelity(sub, self.window) == "reduced"]
 
-            if sub == subreddit:
-                continue
+        return format_drilldown(subreddit, userList, rows, self.banList, self.simList, reduced, self.window)
 
-            if sub not in self.banList:
-                overlap = operator.getitem(row, 1)
-                self.bodyContent += "|/r/{0}|{1}|\n".format(sub, overlap)
 
-            if len(self.bodyStart + self.bodyContent) >= 14000:
-                # so the drilldown doesn't get too big to post
-                break
+    def try_similarity(self, subreddit1, subreddit2):
+        """
+        Calls calculate_similarity() for collect_similarities(),
+        turning a skipped subreddit into None.
+        """
 
-        text = self.bodyStart + self.bodyContent
+        try:
+            return self.calculate_similarity(subreddit1, subreddit2)
 
-        return text
+        except SkipThis:
+            return None
 
 
-    def submit_post(self, subreddit, text):
+    def submit_post(self, subreddit, text, overlaps=None):
         """
         This function submits the results to Reddit. It takes
         two arguments. The first is the subreddit that was
         targeted for the drilldown. The second is the text for
-        the submission thread.
+        the submission thread. A post that goes up before the
+        drilldown is stored also takes the subreddits it lists so
+        far, for the title.
         """
 
         print("Submitting post...")
@@ -690,6 +1735,22 @@ class SubredditAnalysis(object):
         # post to this subreddit
         self.mySubreddit = self.client.get_subreddit(self.post_to)
 
+        # finally submit it
+        return self.mySubreddit.submit(self.post_title(subreddit, overlaps), text)
+
+
+    def post_title(self, subreddit, overlaps=None):
+        """
+        Works out the title of a drilldown's post. With historyTitle
+        on, the title counts the subreddits that joined or left the
+        drilldown in the last month. That's worked out from the
+        overlaps if they're given, which is how a post that goes up
+        during the crawl gets its title, or else from the latest
+        snapshot, which is the drilldown that was just stored. A
+        post's title can't be edited later, so the count in an
+        early post stays as it was when the post went up.
+        """
+
         if(len(self.banList) > 0):
             # thread title
             title = "/r/{0} Drilldown {1}".format(subreddit, datetime.now().strftime("%B %Y"))
@@ -697,8 +1758,21 @@ class SubredditAnalysis(object):
         else:
             title = "/r/{0} Drilldown {1} (Subreddit Bans Disabled)".format(subreddit, datetime.now().strftime("%B %Y"))
 
-        # finally submit it
-        return self.mySubreddit.submit(title, text)
+        if self.window > 0:
+            title += " (Last {0} Days)".format(self.window)
+
+        elif(self.historyTitle):
+            history = DrilldownHistory(subreddit, self.historyDir)
+            summary = history.summary(current=overlaps)
+            history.close()
+
+            if summary is not None:
+                oldDate, joined, left = summary
+                oldMonth = datetime.strptime(oldDate, "%Y-%m-%d").strftime("%B %Y")
+
+                title += " ({0} new, {1} gone since {2})".format(joined, left, oldMonth)
+
+        return title
 
 
     def give_flair(self, submission, flairText):
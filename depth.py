@@ -0,0 +1,58 @@
+# reddit hands out listings 100 items per request
+PAGE_SIZE = 100
+
+
+class OverviewDepth(object):
+
+
+    def __init__(self, stalePages, minPages):
+        """
+        Decides when to stop paging through a user's overview.
+        Paging stops once stalePages pages in a row have turned up
+        no new subreddits above the minimum score, but never before
+        minPages pages have been read. A stalePages of 0 never
+        stops early.
+        """
+
+        self.stalePages = stalePages
+        self.minPages = minPages
+
+        self.seen = set()
+        self.items = 0
+        self.pages = 0
+        self.stale = 0
+        self.foundNew = False
+
+
+    def add(self, subreddit, qualifies):
+        """
+        Feed it every item of the overview in order. Give it the
+        item's subreddit and whether its score is above the
+        minimum. Returns True if the next page shouldn't be
+        requested.
+        """
+
+        if qualifies and subreddit not in self.seen:
+            self.seen.add(subreddit)
+            self.foundNew = True
+
+        self.items += 1
+
+        if self.items % PAGE_SIZE != 0:
+            return False
+
+        # a page just ended
+        self.pages += 1
+
+        if(self.foundNew):
+            self.stale = 0
+
+        else:
+            self.stale += 1
+
+        self.foundNew = False
+
+        if self.stalePages <= 0:
+            return False
+
+        return self.pages >= self.minPages and self.stale >= self.stalePages
@@ -8,3 +8,12 @@ class SkipThis(Exception):
     """
     Gets raised when a subreddit or function needs to be skipped.
     """
+
+
+class CassetteMiss(BaseException):
+    """
+    Gets raised when a replayed run makes a request that
+    the cassette doesn't have a response for. It isn't an
+    Exception, so the catch-alls that skip a subreddit
+    let it through to main().
+    """
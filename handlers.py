@@ -0,0 +1,170 @@
+from threading import Lock
+from time import time
+from praw.handlers import DefaultHandler
+
+
+class HandlerLayer(object):
+
+
+    def __init__(self, handler):
+        """
+        Base class for layers that sit between praw and the
+        handler that actually talks to Reddit. Give it the handler
+        to pass requests down to. Anything a layer doesn't
+        override, such as evict(), goes straight to that handler.
+        """
+
+        self.handler = handler
+
+
+    def request(self, **kwargs):
+        """
+        Called by praw for every request it makes. kwargs holds
+        the prepared request along with praw's rate limiting and
+        caching options. Returns the response.
+        """
+
+        return self.handler.request(**kwargs)
+
+
+    def __getattr__(self, name):
+        return getattr(self.handler, name)
+
+
+class CountingHandler(HandlerLayer):
+
+
+    def __init__(self, handler, parent=None):
+        """
+        Keeps count of how many requests were made and how long
+        they took to answer. Give it another CountingHandler as
+        the parent to have it count these requests as well.
+        """
+
+        HandlerLayer.__init__(self, handler)
+
+        self.parent = parent
+
+        self.count = 0
+        self.elapsed = 0.0
+
+
+    def request(self, **kwargs):
+        start = time()
+
+        try:
+            return self.handler.request(**kwargs)
+
+        finally:
+            self.add(time() - start)
+
+
+    def add(self, elapsed):
+        """
+        Counts one request that took elapsed seconds.
+        """
+
+        self.count += 1
+        self.elapsed += elapsed
+
+        if self.parent is not None:
+            self.parent.add(elapsed)
+
+
+class LockingHandler(HandlerLayer):
+
+
+    def __init__(self, handler):
+        """
+        Lets one request at a time through to one account's layers
+        below, so the harvest threads' clients can share them. praw
+        holds the account's rate limit lock for the whole request
+        anyway, so this doesn't slow the account down. Every
+        account has a lock of its own, so requests on different
+        accounts still run at the same time.
+        """
+
+        HandlerLayer.__init__(self, handler)
+
+        self.lock = Lock()
+
+
+    def request(self, **kwargs):
+        with self.lock:
+            return self.handler.request(**kwargs)
+
+
+class PoolHandler(HandlerLayer):
+
+
+    def __init__(self, pick, tries=1):
+        """
+        Sends each request as one of several logged in clients,
+        through that client's own handlers, so even the pages of a
+        single listing get spread over the accounts. Give it a
+        function that returns the client for the next request,
+        such as ClientPool.next. The request's cookies are swapped
+        for the client's, since they're what log it in. A request
+        that gets a 429 answer is sent again as the next client,
+        up to tries times in all, since praw gives up on a 429
+        instead of waiting.
+        """
+
+        HandlerLayer.__init__(self, None)
+
+        self.pick = pick
+        self.tries = tries
+
+
+    def request(self, request, **kwargs):
+        for i in range(self.tries):
+            client = self.pick()
+
+            pooled = request.copy()
+            pooled.headers.pop("Cookie", None)
+            pooled.prepare_cookies(client.http.cookies)
+
+            response = client.handler.request(request=pooled, **kwargs)
+
+            if response.status_code != 429:
+                break
+
+        return response
+
+
+    @classmethod
+    def evict(cls, urls):
+        """
+        Nothing is cached here, so there's nothing to evict.
+        """
+
+        return 0
+
+
+class AccountHandler(DefaultHandler):
+
+
+    def __init__(self):
+        """
+        praw's handler with a rate limit of its own. praw keeps
+        the time of the last request on the handler class, which
+        would make every account wait on the others. Also keeps
+        the time of the last 429 answer in throttledAt so an
+        account pool can sideline the account for a while.
+        """
+
+        DefaultHandler.__init__(self)
+
+        self.last_call = {}
+        self.rl_lock = Lock()
+
+        self.throttledAt = None
+
+
+    def request(self, **kwargs):
+        response = DefaultHandler.request(self, **kwargs)
+
+        if response.status_code == 429:
+            self.throttledAt = time()
+
+        return response
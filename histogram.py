@@ -0,0 +1,88 @@
+import operator
+from sqlite3 import OperationalError
+
+
+def bucket_of(score, buckets):
+    """
+    Returns the bucket a score falls into, which is the highest
+    edge in buckets that the score is above. Returns None for
+    scores that aren't above any edge. buckets must be sorted.
+    """
+
+    bucket = None
+
+    for edge in buckets:
+        if score > edge:
+            bucket = edge
+
+        else:
+            break
+
+    return bucket
+
+
+def write_histogram(cur, histogram, buckets):
+    """
+    Stores the score histogram of a drilldown. Give it the cursor
+    of the drilldown's database file, a dict that maps each
+    subreddit to a Counter of users per bucket and the list of
+    bucket edges.
+    """
+
+    cur.execute("CREATE TABLE IF NOT EXISTS buckets(edge INT)")
+    cur.execute("CREATE TABLE IF NOT EXISTS histogram(overlaps TEXT, bucket INT, users INT)")
+
+    for edge in buckets:
+        cur.execute("INSERT INTO buckets VALUES(?)", (edge,))
+
+    for subName in histogram:
+        for bucket, users in histogram[subName].items():
+            cur.execute("INSERT INTO histogram VALUES(?, ?, ?)", (subName, bucket, users))
+
+
+def read_buckets(cur):
+    """
+    Returns the bucket edges stored with a drilldown, or an empty
+    list if it was stored without a histogram.
+    """
+
+    try:
+        cur.execute("SELECT edge FROM buckets ORDER BY edge")
+
+    except OperationalError:
+        return []
+
+    return [row[0] for row in cur.fetchall()]
+
+
+def drilldown_at(cur, subreddit, minScore, cutoff=5):
+    """
+    Works out the overlapping users that a drilldown would have
+    found with a different minScore, straight from its stored
+    histogram. A user counts for a subreddit if their best score
+    there was above minScore, so every bucket at or above it gets
+    added up. minScore has to be one of the bucket edges. Give it
+    the cursor of the drilldown's database file, the subreddit the
+    drilldown is for, the minimum score and the fewest overlapping
+    users to include. Returns a list of (subreddit, users) tuples
+    sorted like create_tuples() sorts them, or None if the
+    drilldown has no histogram or minScore isn't a bucket edge.
+    """
+
+    if minScore not in read_buckets(cur):
+        return None
+
+    cur.execute(
+        "SELECT overlaps, SUM(users) FROM histogram WHERE bucket>=? GROUP BY overlaps ORDER BY MIN(rowid)",
+        (minScore,)
+    )
+
+    subredditTuple = []
+
+    for subName, users in cur:
+        if subName.lower() != subreddit.lower() and users >= cutoff:
+            subredditTuple.append((subName, users))
+
+    subredditTuple.sort(key=operator.itemgetter(1), reverse=True)
+
+    return subredditTuple
@@ -0,0 +1,348 @@
+from collections import deque
+from datetime import datetime, timedelta
+import json
+import operator
+import os
+import sqlite3 as db
+import sys
+
+
+class DrilldownHistory(object):
+
+
+    def __init__(self, subreddit, historyDir="history"):
+        """
+        Opens the snapshot history of a subreddit's drilldowns.
+        Every snapshot is stored as the overlaps that changed since
+        the one before it, and the latest overlaps are kept in full
+        so the next delta can be worked out without replaying the
+        history. Give it the subreddit and the directory the
+        history files live in.
+        """
+
+        self.subreddit = subreddit
+
+        if not(os.path.isdir(historyDir)):
+            os.mkdir(historyDir)
+
+        self.con = db.connect(os.path.join(historyDir, "{0}.db".format(subreddit)))
+        cur = self.con.cursor()
+
+        cur.execute("CREATE TABLE IF NOT EXISTS snapshot(ID INTEGER PRIMARY KEY, Date TEXT, Params TEXT, Users INT)")
+
+        # Users is NULL when an overlap dropped out of the drilldown
+        cur.execute("CREATE TABLE IF NOT EXISTS delta(Snapshot INT, Overlap TEXT, Users INT)")
+        cur.execute("CREATE INDEX IF NOT EXISTS delta_overlap ON delta(Overlap, Snapshot)")
+        cur.execute("CREATE INDEX IF NOT EXISTS delta_snapshot ON delta(Snapshot)")
+
+        cur.execute("CREATE TABLE IF NOT EXISTS latest(Overlap TEXT PRIMARY KEY, Users INT)")
+
+        self.con.commit()
+
+
+    def snapshots(self):
+        """
+        Returns every snapshot as a list of (ID, date, params, users)
+        tuples, oldest first.
+        """
+
+        cur = self.con.cursor()
+        cur.execute("SELECT ID, Date, Params, Users FROM snapshot ORDER BY ID")
+
+        return [(ID, date, json.loads(params), users) for ID, date, params, users in cur.fetchall()]
+
+
+    def add(self, subredditTuple, userCount, params, date=None):
+        """
+        Adds a snapshot. Give it the list of (subreddit, overlapping
+        users) tuples, the number of users found, a dict of the
+        settings the crawl ran with and optionally the date of the
+        crawl as YYYY-MM-DD. Snapshots have to be added in date
+        order. Returns the ID of the snapshot, or None if it's older
+        than the latest one.
+        """
+
+        if date is None:
+            date = datetime.now().strftime("%Y-%m-%d")
+
+        cur = self.con.cursor()
+
+        cur.execute("SELECT MAX(Date) FROM snapshot")
+        latestDate = cur.fetchone()[0]
+
+        if latestDate is not None and date < latestDate:
+            return None
+
+        cur.execute("SELECT Overlap, Users FROM latest")
+        previous = dict(cur.fetchall())
+
+        current = {}
+
+        for subName, users in subredditTuple:
+            if subName != self.subreddit:
+                current[subName] = users
+
+        cur.execute(
+            "INSERT INTO snapshot VALUES(NULL, ?, ?, ?)",
+            (date, json.dumps(params, sort_keys=True), userCount)
+        )
+        snapshotID = cur.lastrowid
+
+        for subName, users in current.items():
+            if previous.get(subName) != users:
+                cur.execute("INSERT INTO delta VALUES(?, ?, ?)", (snapshotID, subName, users))
+                cur.execute("INSERT OR REPLACE INTO latest VALUES(?, ?)", (subName, users))
+
+        for subName in previous:
+            if subName not in current:
+                cur.execute("INSERT INTO delta VALUES(?, ?, NULL)", (snapshotID, subName))
+                cur.execute("DELETE FROM latest WHERE Overlap=?", (subName,))
+
+        self.con.commit()
+
+        return snapshotID
+
+
+    def value_at(self, overlap, snapshotID):
+        """
+        Returns the overlapping users a subreddit had as of a
+        snapshot, or None if it wasn't in the drilldown then.
+        """
+
+        cur = self.con.cursor()
+        cur.execute(
+            "SELECT Users FROM delta WHERE Overlap=? AND Snapshot<=? ORDER BY Snapshot DESC LIMIT 1",
+            (overlap, snapshotID)
+        )
+
+        row = cur.fetchone()
+
+        if row is None:
+            return None
+
+        return row[0]
+
+
+    def snapshot_before(self, date):
+        """
+        Returns the ID of the newest snapshot taken on or before
+        the date, given as YYYY-MM-DD, or None if there isn't one.
+        """
+
+        cur = self.con.cursor()
+        cur.execute("SELECT ID FROM snapshot WHERE Date<=? ORDER BY ID DESC LIMIT 1", (date,))
+
+        row = cur.fetchone()
+
+        if row is None:
+            return None
+
+        return row[0]
+
+
+    def overlaps_at(self, snapshotID):
+        """
+        Returns the set of subreddits that were in the drilldown
+        as of a snapshot.
+        """
+
+        cur = self.con.cursor()
+        cur.execute(
+            "SELECT Overlap, Users FROM delta WHERE Snapshot<=? ORDER BY Snapshot",
+            (snapshotID,)
+        )
+
+        # the last delta of each overlap wins
+        latest = dict(cur.fetchall())
+
+        return set(overlap for overlap, users in latest.items() if users is not None)
+
+
+    def changes(self, oldID, newID=None):
+        """
+        Works out how the overlaps changed between two snapshots by
+        only reading the deltas in between. Leave out newID to
+        compare against the latest snapshot. Returns a list of
+        (subreddit, old users, new users) tuples, biggest change
+        first. A users value of None means the subreddit wasn't in
+        that drilldown.
+        """
+
+        cur = self.con.cursor()
+
+        if newID is None:
+            cur.execute("SELECT MAX(ID) FROM snapshot")
+            newID = cur.fetchone()[0]
+
+        cur.execute(
+            "SELECT DISTINCT Overlap FROM delta WHERE Snapshot>? AND Snapshot<=?",
+            (oldID, newID)
+        )
+        touched = [row[0] for row in cur.fetchall()]
+
+        changes = []
+
+        for overlap in touched:
+            old = self.value_at(overlap, oldID)
+            new = self.value_at(overlap, newID)
+
+            if old != new:
+                changes.append((overlap, old, new))
+
+        changes.sort(key=lambda change: abs((change[2] or 0) - (change[1] or 0)), reverse=True)
+
+        return changes
+
+
+    def trend(self, overlap):
+        """
+        Returns the overlapping users a subreddit had in every
+        snapshot as a list of (date, users) tuples, oldest first.
+        """
+
+        cur = self.con.cursor()
+        cur.execute("SELECT Snapshot, Users FROM delta WHERE Overlap=? ORDER BY Snapshot", (overlap,))
+        deltas = deque(cur.fetchall())
+
+        trend = []
+        users = None
+
+        for snapshotID, date, params, userCount in self.snapshots():
+            # carry the last value forward until the next delta
+            while deltas and operator.getitem(deltas[0], 0) <= snapshotID:
+                users = operator.getitem(deltas.popleft(), 1)
+
+            trend.append((date, users))
+
+        return trend
+
+
+    def summary(self, months=1, current=None):
+        """
+        Compares the latest snapshot with the newest one that's at
+        least the given number of months older. Give it the
+        subreddits of a drilldown that isn't stored yet as current
+        to compare those instead, as of today. Returns the date of
+        the older snapshot, how many subreddits joined the
+        drilldown and how many left it, or None if there's nothing
+        old enough.
+        """
+
+        history = self.snapshots()
+
+        if current is None:
+            if len(history) < 2:
+                return None
+
+            latestDate = datetime.strptime(operator.getitem(history[-1], 1), "%Y-%m-%d")
+            current = self.overlaps_at(operator.getitem(history[-1], 0))
+
+        else:
+            latestDate = datetime.now()
+            current = set(current) - set([self.subreddit])
+
+        cutoff = (latestDate - timedelta(days=28 * months)).strftime("%Y-%m-%d")
+
+        oldID = self.snapshot_before(cutoff)
+
+        if oldID is None:
+            return None
+
+        oldDate = [date for ID, date, params, users in history if ID == oldID][0]
+
+        old = self.overlaps_at(oldID)
+
+        return (oldDate, len(current - old), len(old - current))
+
+
+    def close(self):
+        """
+        Closes the history file.
+        """
+
+        self.con.close()
+
+
+def main():
+    """
+    Looks through the drilldown history. Usage:
+
+        python history.py list <subreddit>
+        python history.py diff <subreddit> [YYYY-MM-DD]
+        python history.py trend <subreddit> <overlapping subreddit>
+        python history.py import <subreddit> <drilldown.db> <YYYY-MM-DD>
+
+    diff compares the latest snapshot with the newest one from on
+    or before the date, which defaults to a month before the
+    latest. import adds a drilldown file kept by hand as a
+    snapshot from that date.
+    """
+
+    args = sys.argv[1:]
+
+    if len(args) < 2:
+        print(main.__doc__)
+        sys.exit(1)
+
+    command = args[0]
+    history = DrilldownHistory(args[1])
+
+    if command == "list":
+        for ID, date, params, users in history.snapshots():
+            print("{0}  {1} users  {2}".format(date, users, json.dumps(params, sort_keys=True)))
+
+    elif command == "diff":
+        snapshots = history.snapshots()
+
+        if len(snapshots) < 2:
+            print("/r/{0} needs at least 2 snapshots to compare.".format(args[1]))
+            sys.exit(1)
+
+        if len(args) > 2:
+            since = args[2]
+
+        else:
+            latestDate = datetime.strptime(operator.getitem(snapshots[-1], 1), "%Y-%m-%d")
+            since = (latestDate - timedelta(days=28)).strftime("%Y-%m-%d")
+
+        oldID = history.snapshot_before(since)
+
+        if oldID is None:
+            oldID = operator.getitem(snapshots[0], 0)
+
+        print("| Subreddit | Before | Now |")
+        print("|:------|------:|------:|")
+
+        for overlap, old, new in history.changes(oldID):
+            print("|/r/{0}|{1}|{2}|".format(overlap, '-' if old is None else old, '-' if new is None else new))
+
+    elif command == "trend" and len(args) > 2:
+        for date, users in history.trend(args[2]):
+            print("{0}  {1}".format(date, '-' if users is None else users))
+
+    elif command == "import" and len(args) > 3:
+        con = db.connect(args[2])
+        cur = con.cursor()
+        cur.execute("SELECT overlaps, users FROM drilldown")
+        rows = cur.fetchall()
+        con.close()
+
+        userCount = 0
+
+        for subName, users in rows:
+            if subName == args[1]:
+                userCount = users
+
+        if history.add(rows, userCount, {}, args[3]) is None:
+            print("Snapshots have to be imported oldest first.")
+            sys.exit(1)
+
+    else:
+        print(main.__doc__)
+        sys.exit(1)
+
+    history.close()
+
+
+if __name__ == "__main__":
+    main()
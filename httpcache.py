@@ -0,0 +1,211 @@
+import json
+import re
+import sqlite3 as db
+from time import time
+import zlib
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from handlers import HandlerLayer
+
+
+class ConditionalCacheHandler(HandlerLayer):
+
+
+    def __init__(self, handler, cacheFile, maxAge, maxEntries, cachePaths):
+        """
+        Keeps the responses to GET requests in a file so repeated
+        runs don't fetch the same listings again. Entries younger
+        than maxAge seconds are answered without any request.
+        Older ones are sent as conditional requests with their ETag
+        and Last-Modified validators, and a 304 answer reuses the
+        stored body. Only URLs matching one of the cachePaths
+        regular expressions are cached, and the least recently
+        used entries are dropped past maxEntries.
+        """
+
+        HandlerLayer.__init__(self, handler)
+
+        self.maxAge = maxAge
+        self.maxEntries = maxEntries
+        self.cachePaths = [re.compile(path) for path in cachePaths]
+
+        # used from the harvest threads too, one at a time
+        self.con = db.connect(cacheFile, check_same_thread=False)
+        cur = self.con.cursor()
+
+        cur.execute("CREATE TABLE IF NOT EXISTS entry(Url TEXT PRIMARY KEY, Etag TEXT, LastModified TEXT, Stored REAL, Used REAL, Status INT, Reason TEXT, Headers TEXT, Body BLOB)")
+        cur.execute("CREATE INDEX IF NOT EXISTS entry_used ON entry(Used)")
+
+        self.con.commit()
+
+        # answered from the file without a request
+        self.hits = 0
+
+        # answered with a 304 from Reddit
+        self.revalidated = 0
+
+        # fetched in full
+        self.misses = 0
+
+
+    def cacheable(self, request):
+        """
+        Returns True if the response to a request may be cached.
+        """
+
+        if request.method != "GET":
+            return False
+
+        for path in self.cachePaths:
+            if path.search(request.url):
+                return True
+
+        return False
+
+
+    def stored_response(self, request, row):
+        """
+        Turns a stored entry back into a response for praw.
+        """
+
+        status, reason, headers, body = row
+
+        response = Response()
+        response.url = request.url
+        response.status_code = status
+        response.reason = reason
+        response.headers = CaseInsensitiveDict(json.loads(headers))
+        response._content = zlib.decompress(body)
+        response.encoding = "utf-8"
+        response.request = request
+
+        return response
+
+
+    def store(self, request, response):
+        """
+        Saves a response and drops the least recently used entries
+        if there are too many.
+        """
+
+        now = time()
+        cur = self.con.cursor()
+
+        cur.execute(
+            "INSERT OR REPLACE INTO entry VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (request.url, response.headers.get("ETag"), response.headers.get("Last-Modified"),
+             now, now, response.status_code, response.reason,
+             json.dumps(dict(response.headers)), zlib.compress(response.content))
+        )
+
+        cur.execute("SELECT COUNT(*) FROM entry")
+        extra = cur.fetchone()[0] - self.maxEntries
+
+        if extra > 0:
+            cur.execute(
+                "DELETE FROM entry WHERE Url IN (SELECT Url FROM entry ORDER BY Used LIMIT ?)",
+                (extra,)
+            )
+
+        self.con.commit()
+
+
+    def request(self, **kwargs):
+        request = kwargs["request"]
+
+        if not(self.cacheable(request)):
+            return self.handler.request(**kwargs)
+
+        cur = self.con.cursor()
+        cur.execute(
+            "SELECT Etag, LastModified, Stored, Status, Reason, Headers, Body FROM entry WHERE Url=?",
+            (request.url,)
+        )
+
+        row = cur.fetchone()
+
+        if row is None:
+            response = self.handler.request(**kwargs)
+            self.misses += 1
+
+            if response.status_code == 200:
+                self.store(request, response)
+
+            return response
+
+        etag, lastModified, stored = row[:3]
+        now = time()
+
+        if now - stored < self.maxAge:
+            self.hits += 1
+
+            cur.execute("UPDATE entry SET Used=? WHERE Url=?", (now, request.url))
+            self.con.commit()
+
+            return self.stored_response(request, row[3:])
+
+        if etag is not None:
+            request.headers["If-None-Match"] = etag
+
+        if lastModified is not None:
+            request.headers["If-Modified-Since"] = lastModified
+
+        response = self.handler.request(**kwargs)
+
+        if response.status_code == 304:
+            self.revalidated += 1
+
+            cur.execute("UPDATE entry SET Stored=?, Used=? WHERE Url=?", (now, now, request.url))
+            self.con.commit()
+
+            return self.stored_response(request, row[3:])
+
+        self.misses += 1
+
+        if response.status_code == 200:
+            self.store(request, response)
+
+        return response
+
+
+    def evict(self, urls):
+        """
+        Drops the entries for URLs that praw says have changed,
+        then lets the handler underneath evict them too.
+        """
+
+        cur = self.con.cursor()
+
+        for url in urls:
+            cur.execute("DELETE FROM entry WHERE Url LIKE ?", (url + '%',))
+
+        self.con.commit()
+
+        return self.handler.evict(urls)
+
+
+    def report(self):
+        """
+        Returns a line describing how well the cache did.
+        """
+
+        return report_caches([self])
+
+
+def report_caches(caches):
+    """
+    Returns a line describing how well several caches did
+    together, such as the caches of every account in a pool.
+    """
+
+    hits = sum(cache.hits for cache in caches)
+    revalidated = sum(cache.revalidated for cache in caches)
+    misses = sum(cache.misses for cache in caches)
+
+    total = hits + revalidated + misses
+
+    if total == 0:
+        return "HTTP cache unused."
+
+    return "HTTP cache: {0} hits, {1} revalidated, {2} misses ({3:.1f}% served without a full fetch).".format(
+        hits, revalidated, misses, 100.0 * (hits + revalidated) / total)
@@ -1,14 +1,12 @@
 import logging
 import operator
-import os
 import sqlite3 as db
 from sqlite3 import OperationalError
 from socket import timeout
 import sys
 from time import sleep
-from praw.errors import *
-from requests.exceptions import HTTPError
-from crawler import SubredditAnalysis
+from planner import order
+from render import drilldown_path, read_fidelity
 from exceptions import *
 
 
@@ -133,20 +131,28 @@ def main():
         # check to make sure each subreddit is valid
         check_subreddits(drilldownList)
 
+        # run the cheapest drilldowns first
+        if(myBot.config.main.getboolean("planOrder")):
+            drilldownList, plan = order(drilldownList, myBot.config)
+            print(plan)
+
         # iterate through the drilldownList to get data
         for subreddit in drilldownList:
 
             # check to see if a drilldown for this subreddit
             # was already done
-            dbFile = "{0}.db".format(subreddit)
+            dbFile = drilldown_path(subreddit, myBot.window)
 
             if(subreddit in ["quit", ".quit", 'q']):
+                myBot.report_requests()
                 print("Quitting...")
                 
                 sys.exit(0)
 
-            elif(os.path.isfile("subreddits/{0}".format(dbFile))):
-                con = db.connect("subreddits/{0}".format(dbFile))
+            # reduced counterpart drilldowns aren't posted, they
+            # get crawled again in full
+            elif(read_fidelity(subreddit, myBot.window) == "full"):
+                con = db.connect(dbFile)
                 cur = con.cursor()
 
                 sub = (subreddit,)
@@ -235,11 +241,14 @@ def main():
                 myBot.log_info("\n\n")
 
 
+                # publishes partial results while the scan runs
+                progress = myBot.start_progress(subreddit)
+
                 try:
                     while True:
                         try:
                             # get the list of subreddits
-                            subredditList = myBot.get_subs(userList)
+                            subredditList = myBot.get_subs(userList, progress)
                             myBot.subredditList = []
                             break
 
@@ -290,29 +299,43 @@ def main():
                     continue
 
 
-                try:
-                    while True:
-                        try:
-                            # submit the post for Reddit
-                            post = myBot.submit_post(subreddit, text)
-                            break
+                post = None
 
-                        except (ConnectionResetError, HTTPError, timeout) as e:
-                            myBot.add_msg(e)
-                            logging.error(str(e) + "\n\n")
-                            myBot.add_msg("Waiting to try again...")
-                            sleep(60)
-                            continue
+                if progress is not None:
+                    try:
+                        # the partial post gets the final text
+                        post = progress.finish(text)
 
-                        except (APIException, ClientException, Exception) as e:
-                            myBot.add_msg(e)
-                            logging.error(str(e) + "\n\n")
-                            raise SkipThis("Couldn't submit post. Skipping...")
+                    except (APIException, ClientException, Exception) as e:
+                        myBot.add_msg(e)
+                        logging.error("Failed to update post. " + str(e) + "\n\n")
+                        myBot.log_post(subreddit, text)
+                        continue
 
-                except SkipThis:
-                    logging.error(str(e) + "\n\n")
-                    myBot.log_post(subreddit, text)
-                    continue
+                if post is None:
+                    try:
+                        while True:
+                            try:
+                                # submit the post for Reddit
+                                post = myBot.submit_post(subreddit, text)
+                                break
+
+                            except (ConnectionResetError, HTTPError, timeout) as e:
+                                myBot.add_msg(e)
+                                logging.error(str(e) + "\n\n")
+                                myBot.add_msg("Waiting to try again...")
+                                sleep(60)
+                                continue
+
+                            except (APIException, ClientException, Exception) as e:
+                                myBot.add_msg(e)
+                                logging.error(str(e) + "\n\n")
+                                raise SkipThis("Couldn't submit post. Skipping...")
+
+                    except SkipThis:
+                        logging.error(str(e) + "\n\n")
+                        myBot.log_post(subreddit, text)
+                        continue
 
                 if(post != None):
                     try:
@@ -334,8 +357,24 @@ def main():
                     except SkipThis:
                         continue
 
+        myBot.report_requests()
+
 
 if __name__ == "__main__":
+    # rendering from the cache needs neither praw nor a login,
+    # so the network stack is only imported after this
+    if "--offline" in sys.argv[1:]:
+        sys.argv.remove("--offline")
+
+        from offline import main as render_offline
+        render_offline()
+
+        sys.exit(0)
+
+    from praw.errors import *
+    from requests.exceptions import HTTPError
+    from crawler import SubredditAnalysis
+
     myBot = SubredditAnalysis()
 
     if(myBot.errorLogging):
@@ -347,4 +386,14 @@ if __name__ == "__main__":
             level=logging.ERROR
         )
 
-    main()
+    try:
+        main()
+
+    # a replay asked for a request that was never recorded, so
+    # the rest of the run can't match the recording anyway
+    except CassetteMiss as e:
+        print('\n' + str(e))
+        print("The cassette doesn't match this run. Record it again with the same settings and subreddits.")
+        logging.error(str(e) + "\n\n")
+        myBot.report_requests()
+        sys.exit(1)
@@ -0,0 +1,137 @@
+from time import time
+
+# taken before anything else is imported so the startup
+# time covers the imports too
+startTime = time()
+
+import glob
+import os
+import sys
+from render import collect_similarities, format_drilldown, is_windowed, read_drilldown, read_fidelity, similarity_from_cache
+from settings import read_banlist, read_config
+
+
+def cached_similarity(window):
+    """
+    Returns a similarity function for collect_similarities()
+    that never crawls and uses the drilldowns for the given
+    window. Subreddits without a stored drilldown are skipped.
+    """
+
+    def similarity(subreddit1, subreddit2):
+        value = similarity_from_cache(subreddit1, subreddit2, window)
+
+        if value is None:
+            return None
+
+        return (subreddit2, value)
+
+    return similarity
+
+
+def main():
+    """
+    Renders drilldown posts straight from subreddits/ without
+    logging in or loading praw. Usage:
+
+        python offline.py [--out DIR] [--time] [--window N] <subreddit> [subreddit ...]
+        python offline.py [--out DIR] [--time] [--window N] --all
+
+    Posts are printed unless --out is given, in which case each
+    one is written to DIR/<subreddit>.md. Similarities only use
+    counterparts that already have a drilldown. --window renders
+    the drilldowns of the last N days instead of the all-time
+    ones.
+    """
+
+    args = sys.argv[1:]
+
+    outDir = None
+    timing = False
+    window = 0
+    allSubreddits = False
+    subreddits = []
+
+    while args:
+        arg = args.pop(0)
+
+        if arg == "--out" and args:
+            outDir = args.pop(0)
+
+        elif arg == "--time":
+            timing = True
+
+        elif arg == "--window" and args:
+            window = int(args.pop(0))
+
+        elif arg == "--all":
+            allSubreddits = True
+
+        else:
+            subreddits.append(arg)
+
+    if(allSubreddits):
+        for path in sorted(glob.glob("subreddits/*.db")):
+            if not(is_windowed(path)):
+                subreddits.append(os.path.basename(path)[:-3])
+
+    if len(subreddits) == 0:
+        print(main.__doc__)
+        sys.exit(1)
+
+    config = read_config()
+
+    similarity = config.main.getboolean("similarity")
+    similarityLimit = int(config.main.similarityLimit)
+
+    banList = read_banlist(config)
+
+    if outDir is not None and not(os.path.isdir(outDir)):
+        os.mkdir(outDir)
+
+    readyTime = time()
+    rendered = 0
+
+    for subreddit in subreddits:
+        drilldown = read_drilldown(subreddit, window)
+
+        if drilldown is None:
+            sys.stderr.write("No drilldown stored for /r/{0}. Skipping...\n".format(subreddit))
+            continue
+
+        userCount, rows = drilldown
+
+        simList = None
+        reduced = []
+
+        if(similarity):
+            simList = collect_similarities(subreddit, rows, banList, similarityLimit, cached_similarity(window))
+            reduced = [sub for sub, sim in simList if read_fidelity(sub, window) == "reduced"]
+
+        text = format_drilldown(subreddit, userCount, rows, banList, simList, reduced, window)
+
+        if outDir is None:
+            print(text)
+
+        else:
+            with open(os.path.join(outDir, "{0}.md".format(subreddit)), 'w') as f:
+                f.write(text)
+
+        rendered += 1
+
+    doneTime = time()
+
+    if(timing):
+        # stderr so the timings don't end up in piped posts
+        sys.stderr.write("Startup: {0:.1f} ms\n".format((readyTime - startTime) * 1000))
+        sys.stderr.write("Rendered {0} reports in {1:.1f} ms".format(rendered, (doneTime - readyTime) * 1000))
+
+        if rendered > 0:
+            sys.stderr.write(" ({0:.2f} ms each)".format((doneTime - readyTime) * 1000 / rendered))
+
+        sys.stderr.write("\nNetwork stack loaded: {0}\n".format(
+            "yes" if "praw" in sys.modules or "requests" in sys.modules else "no"))
+
+
+if __name__ == "__main__":
+    main()
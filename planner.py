@@ -0,0 +1,593 @@
+import operator
+import os
+import sqlite3 as db
+from sqlite3 import OperationalError
+import sys
+from depth import PAGE_SIZE
+from history import DrilldownHistory
+from render import read_drilldown, read_fidelity
+from settings import read_banlist, read_config
+
+# praw waits this many seconds between requests to reddit.com
+DEFAULT_DELAY = 2.0
+
+# requests for submitting a post and setting its flair
+POST_REQUESTS = 2
+
+COMMANDS = ["quit", ".quit", 'q']
+
+
+class CachedPosters(object):
+
+
+    def __init__(self, minScore, statsFile="stats.db", usersDir="users"):
+        """
+        Keeps track in stats.db of the subreddits each cached user
+        posted in with a score above minScore, which is what a
+        harvest would pick them up for. Only the user files that
+        were added or changed since the last count get read, so
+        planning doesn't go through the whole cache every time.
+        """
+
+        self.minScore = minScore
+        self.usersDir = usersDir
+
+        self.con = db.connect(statsFile)
+        cur = self.con.cursor()
+
+        cur.execute("CREATE TABLE IF NOT EXISTS poster(User TEXT, Subreddit TEXT)")
+        cur.execute("CREATE INDEX IF NOT EXISTS poster_subreddit ON poster(Subreddit)")
+        cur.execute("CREATE INDEX IF NOT EXISTS poster_user ON poster(User)")
+
+        # when each user file was counted, and for which minScore
+        cur.execute("CREATE TABLE IF NOT EXISTS counted(User TEXT PRIMARY KEY, Modified REAL, MinScore INT)")
+
+        self.con.commit()
+
+
+    def read_user(self, path):
+        """
+        Returns the subreddits a cached user posted in with a score
+        above minScore, in lower case. Unreadable files count as
+        having none.
+        """
+
+        con = db.connect(path)
+        cur = con.cursor()
+
+        try:
+            try:
+                cur.execute("SELECT Overlap FROM aggregate WHERE MaxScore>?", (self.minScore,))
+
+            # written before the aggregate table existed
+            except OperationalError:
+                cur.execute("SELECT Overlap FROM user GROUP BY Overlap HAVING MAX(Score)>?", (self.minScore,))
+
+            subreddits = set(operator.getitem(row, 0).lower() for row in cur.fetchall())
+
+        except OperationalError:
+            subreddits = set()
+
+        con.close()
+
+        return subreddits
+
+
+    def update(self):
+        """
+        Brings the counts up to date with the user cache, reading
+        only the files that changed since they were counted.
+        """
+
+        cur = self.con.cursor()
+
+        cur.execute("SELECT User, Modified, MinScore FROM counted")
+        counted = dict((user, (modified, minScore)) for user, modified, minScore in cur.fetchall())
+
+        files = []
+
+        if os.path.isdir(self.usersDir):
+            files = [name for name in os.listdir(self.usersDir) if name.endswith(".db")]
+
+        for name in files:
+            user = name[:-3]
+            path = os.path.join(self.usersDir, name)
+
+            try:
+                modified = os.path.getmtime(path)
+
+            except OSError:
+                continue
+
+            if counted.pop(user, None) == (modified, self.minScore):
+                continue
+
+            cur.execute("DELETE FROM poster WHERE User=?", (user,))
+            cur.executemany("INSERT INTO poster VALUES(?, ?)", [(user, sub) for sub in self.read_user(path)])
+            cur.execute("INSERT OR REPLACE INTO counted VALUES(?, ?, ?)", (user, modified, self.minScore))
+
+        # whatever is left was removed from the cache
+        for user in counted:
+            cur.execute("DELETE FROM poster WHERE User=?", (user,))
+            cur.execute("DELETE FROM counted WHERE User=?", (user,))
+
+        self.con.commit()
+
+
+    def count(self, subreddit):
+        """
+        Returns how many cached users posted in a subreddit with a
+        score above minScore.
+        """
+
+        cur = self.con.cursor()
+        cur.execute("SELECT COUNT(*) FROM poster WHERE Subreddit=?", (subreddit.lower(),))
+
+        return cur.fetchone()[0]
+
+
+    def close(self):
+        """
+        Closes stats.db.
+        """
+
+        self.con.close()
+
+
+class CrawlStats(object):
+
+
+    def __init__(self, statsFile="stats.db"):
+        """
+        Reads what earlier runs recorded in stats.db about harvesting
+        users and scanning them. Everything falls back to a guess
+        worked out from the settings when there's nothing recorded.
+        """
+
+        self.harvests = []
+        self.scans = []
+
+        if not(os.path.isfile(statsFile)):
+            return
+
+        con = db.connect(statsFile)
+        cur = con.cursor()
+
+        try:
+            cur.execute("SELECT Subreddit, Mode, Users, Requests FROM harvest ORDER BY rowid")
+            self.harvests = cur.fetchall()
+
+        except db.OperationalError:
+            pass
+
+        try:
+            cur.execute("SELECT Subreddit, Users, Cached, Requests, Seconds FROM scan ORDER BY rowid")
+            self.scans = cur.fetchall()
+
+        except db.OperationalError:
+            pass
+
+        con.close()
+
+
+    def expected_users(self, subreddit):
+        """
+        Returns how many users the last harvest of a subreddit
+        found, or the average over every harvest if it was never
+        harvested, or None if nothing was recorded.
+        """
+
+        users = None
+
+        for sub, mode, userCount, requests in self.harvests:
+            if sub == subreddit:
+                users = userCount
+
+        if users is None and len(self.harvests) > 0:
+            users = sum(row[2] for row in self.harvests) // len(self.harvests)
+
+        return users
+
+
+    def harvest_rate(self, subreddit, mode):
+        """
+        Returns the requests per user found that harvesting a
+        subreddit took last time in this mode, or the average over
+        every subreddit, or None if nothing was recorded.
+        """
+
+        rows = [row for row in self.harvests if operator.getitem(row, 1) == mode and operator.getitem(row, 2) > 0]
+        own = [row for row in rows if operator.getitem(row, 0) == subreddit]
+
+        if len(own) > 0:
+            rows = own[-1:]
+
+        if len(rows) == 0:
+            return None
+
+        return float(sum(row[3] for row in rows)) / sum(row[2] for row in rows)
+
+
+    def scanned(self, subreddit):
+        """
+        Returns True if a scan of the subreddit was recorded.
+        """
+
+        return any(sub == subreddit and users > 0 for sub, users, cached, requests, seconds in self.scans)
+
+
+    def hit_rate(self, subreddit):
+        """
+        Returns the expected share of users that are already cached.
+        A subreddit that was scanned before uses how often repeat
+        scans found their users cached, anything else how often any
+        scan did. Returns 0 if nothing was recorded.
+        """
+
+        seen = set()
+        first = []
+        repeat = []
+
+        for sub, users, cached, requests, seconds in self.scans:
+            if users == 0:
+                continue
+
+            if sub in seen:
+                repeat.append(float(cached) / users)
+
+            else:
+                first.append(float(cached) / users)
+
+            seen.add(sub)
+
+        if subreddit in seen and len(repeat) > 0:
+            return sum(repeat) / len(repeat)
+
+        rates = first + repeat
+
+        if len(rates) == 0:
+            return 0.0
+
+        return sum(rates) / len(rates)
+
+
+    def requests_per_user(self):
+        """
+        Returns the requests an uncached user took on average, or
+        None if nothing was recorded.
+        """
+
+        users = sum(row[1] - row[2] for row in self.scans)
+        requests = sum(row[3] for row in self.scans)
+
+        if users <= 0:
+            return None
+
+        return float(requests) / users
+
+
+    def seconds_per_request(self):
+        """
+        Returns how long a request took on average, rate limiting
+        included, or None if nothing was recorded.
+        """
+
+        requests = sum(row[3] for row in self.scans)
+        seconds = sum(row[4] for row in self.scans)
+
+        if requests == 0:
+            return None
+
+        return seconds / requests
+
+
+class Planner(object):
+
+
+    def __init__(self, config, stats, posters):
+        """
+        Estimates what drilldowns will cost from the settings, the
+        caches and the recorded stats, without any requests. Give
+        it the CrawlStats and an up to date CachedPosters.
+        """
+
+        self.config = config
+        self.stats = stats
+
+        self.harvestMode = config.main.harvestMode
+        self.scrapeLimit = int(config.main.scrapeLimit)
+        self.overviewLimit = int(config.main.overviewLimit)
+        self.userLimit = int(config.main.userLimit)
+        self.window = int(config.main.window)
+
+        self.similarity = config.main.getboolean("similarity")
+        self.similarityLimit = int(config.main.similarityLimit)
+        self.tieredSimilarity = config.main.getboolean("tieredSimilarity")
+
+        self.banList = read_banlist(config)
+
+        self.posters = posters
+
+        # every account reads at the full rate
+        self.accounts = 1
+
+        if config.cassette.mode == "off":
+            self.accounts += len([entry for entry in config.login.accounts.split(',') if ':' in entry])
+
+        self.secondsPerRequest = stats.seconds_per_request()
+
+        if self.secondsPerRequest is None:
+            self.secondsPerRequest = DEFAULT_DELAY
+
+        self.progressive = config.progress.getboolean("progressive")
+        self.maxEdits = int(config.progress.maxEdits)
+
+
+    def crawl_cost(self, subreddit, scrapeLimit, overviewLimit, userLimit):
+        """
+        Estimates a crawl of a subreddit with the given limits.
+        Returns the harvest requests, the scan requests, the
+        expected users and the share of them already cached.
+        """
+
+        users = self.stats.expected_users(subreddit)
+
+        if users is None or users > userLimit:
+            users = userLimit
+
+        rate = self.stats.harvest_rate(subreddit, self.harvestMode)
+
+        if rate is not None:
+            harvest = rate * users
+
+        elif self.harvestMode == "listings":
+            # a page of comments or submissions per PAGE_SIZE users
+            harvest = 2.0 * users / PAGE_SIZE
+
+        else:
+            # the hot list plus at least one comment page per thread
+            harvest = float(scrapeLimit) / PAGE_SIZE + scrapeLimit
+
+        if(self.stats.scanned(subreddit)):
+            hitRate = self.stats.hit_rate(subreddit)
+
+        elif users > 0:
+            # the cached users that posted there are the ones a
+            # first scan would find in the cache
+            posters = 0
+
+            if subreddit is not None:
+                posters = self.posters.count(subreddit)
+
+            hitRate = min(users, posters) / float(users)
+
+        else:
+            hitRate = 0.0
+
+        perUser = self.stats.requests_per_user()
+
+        if perUser is None:
+            perUser = float(overviewLimit) / PAGE_SIZE
+
+        else:
+            # recorded scans ran with the full overviewLimit
+            perUser *= min(1.0, float(overviewLimit) / self.overviewLimit)
+
+        scan = users * (1 - hitRate) * perUser
+
+        return (int(harvest), int(scan), users, hitRate)
+
+
+    def counterparts(self, subreddit):
+        """
+        Works out which subreddits calculate_similarity() would have
+        to drill for a subreddit, from its stored drilldown or its
+        latest snapshot. Returns the list of them, or None if there's
+        nothing to work it out from.
+        """
+
+        drilldown = read_drilldown(subreddit, self.window)
+
+        if drilldown is not None:
+            rows = operator.getitem(drilldown, 1)
+
+        elif self.window == 0 and os.path.isfile(os.path.join(self.config.history.historyDir, "{0}.db".format(subreddit))):
+            history = DrilldownHistory(subreddit, self.config.history.historyDir)
+
+            cur = history.con.cursor()
+            cur.execute("SELECT Overlap, Users FROM latest ORDER BY Users DESC")
+            rows = cur.fetchall()
+
+            history.close()
+
+        else:
+            return None
+
+        candidates = []
+
+        for sub, users in rows:
+            if sub == subreddit or sub in self.banList:
+                continue
+
+            if len(candidates) == self.similarityLimit:
+                break
+
+            candidates.append(sub)
+
+        return [sub for sub in candidates if read_fidelity(sub, self.window) is None]
+
+
+    def estimate(self, subreddit):
+        """
+        Estimates the cost of one drilldown. Returns a dict with the
+        requests per stage, the expected users and cache hits, the
+        counterparts to drill and the wall clock time in seconds.
+        """
+
+        plan = {"subreddit": subreddit, "stored": read_fidelity(subreddit, self.window) == "full"}
+
+        if plan["stored"]:
+            harvest, scan, users, hitRate = (0, 0, 0, 1.0)
+
+        else:
+            harvest, scan, users, hitRate = self.crawl_cost(
+                subreddit, self.scrapeLimit, self.overviewLimit, self.userLimit
+            )
+
+        plan["harvest"] = harvest
+        plan["scan"] = scan
+        plan["users"] = users
+        plan["cached"] = int(users * hitRate)
+
+        similarity = 0
+        counterparts = []
+        plan["guessed"] = False
+
+        if(self.similarity):
+            counterparts = self.counterparts(subreddit)
+
+            if counterparts is None:
+                # nothing to go on, so assume none are stored yet
+                counterparts = [None] * self.similarityLimit
+                plan["guessed"] = True
+
+            for sub in counterparts:
+                if(self.tieredSimilarity):
+                    cost = self.crawl_cost(
+                        sub,
+                        int(self.config.main.counterpartScrapeLimit),
+                        int(self.config.main.counterpartOverviewLimit),
+                        int(self.config.main.counterpartUserLimit)
+                    )
+
+                else:
+                    cost = self.crawl_cost(sub, self.scrapeLimit, self.overviewLimit, self.userLimit)
+
+                similarity += operator.getitem(cost, 0) + operator.getitem(cost, 1)
+
+        plan["counterparts"] = len(counterparts)
+        plan["similarity"] = similarity
+
+        plan["post"] = POST_REQUESTS
+
+        if(self.progressive) and not(plan["stored"]):
+            plan["post"] += self.maxEdits
+
+        plan["requests"] = harvest + scan + similarity + plan["post"]
+        plan["seconds"] = plan["requests"] * self.secondsPerRequest / self.accounts
+
+        return plan
+
+
+    def plan(self, subreddits):
+        """
+        Estimates every drilldown in a batch. Returns the estimates
+        cheapest first.
+        """
+
+        plans = [self.estimate(subreddit) for subreddit in subreddits if subreddit not in COMMANDS]
+        plans.sort(key=operator.itemgetter("requests"))
+
+        return plans
+
+
+def format_duration(seconds):
+    """
+    Returns a duration as hours and minutes.
+    """
+
+    minutes = int(seconds / 60 + 0.5)
+
+    return "{0}h {1:02d}m".format(minutes // 60, minutes % 60)
+
+
+def format_plan(plans, planner):
+    """
+    Formats a list of estimates as a table, with the totals at the
+    bottom.
+    """
+
+    lines = []
+
+    lines.append("Plan for {0} drilldowns at {1:.2f} seconds per request with {2} account(s):".format(
+        len(plans), planner.secondsPerRequest, planner.accounts))
+    lines.append('')
+    lines.append("{0:<24}{1:>9}{2:>9}{3:>16}{4:>14}{5:>10}{6:>10}".format(
+        "Subreddit", "Harvest", "Scan", "Cached users", "Counterparts", "Requests", "Time"))
+
+    for plan in plans:
+        if(plan["stored"]):
+            cached = "stored"
+
+        else:
+            cached = "{0}/{1}".format(plan["cached"], plan["users"])
+
+        counterparts = str(plan["counterparts"])
+
+        if(plan["guessed"]):
+            counterparts += '?'
+
+        lines.append("{0:<24}{1:>9}{2:>9}{3:>16}{4:>14}{5:>10}{6:>10}".format(
+            plan["subreddit"], plan["harvest"], plan["scan"], cached, counterparts,
+            plan["requests"], format_duration(plan["seconds"])))
+
+    lines.append('')
+    lines.append("Total: {0} requests, about {1}.".format(
+        sum(plan["requests"] for plan in plans), format_duration(sum(plan["seconds"] for plan in plans))))
+
+    return '\n'.join(lines)
+
+
+def order(subreddits, config):
+    """
+    Reorders a batch so the cheapest drilldowns run first. Quit
+    commands stay at the end. Returns the new list and the
+    formatted plan.
+    """
+
+    posters = CachedPosters(int(config.main.minScore))
+    posters.update()
+
+    planner = Planner(config, CrawlStats(), posters)
+    plans = planner.plan(subreddits)
+
+    posters.close()
+
+    commands = [subreddit for subreddit in subreddits if subreddit in COMMANDS]
+
+    return ([plan["subreddit"] for plan in plans] + commands, format_plan(plans, planner))
+
+
+def main():
+    """
+    Estimates what a batch of drilldowns will cost before any of
+    them runs, from the settings, the caches and stats.db. Usage:
+
+        python planner.py [--order] <subreddit> [subreddit ...]
+
+    Prints the plan cheapest first. --order only prints the
+    subreddits in that order, for pasting into the bot. A ? after
+    the counterparts means there was no earlier drilldown to work
+    them out from, so every one is assumed to need a crawl.
+    """
+
+    args = sys.argv[1:]
+
+    orderOnly = "--order" in args
+    subreddits = [arg for arg in args if arg != "--order"]
+
+    if len(subreddits) == 0:
+        print(main.__doc__)
+        sys.exit(1)
+
+    ordered, text = order(subreddits, read_config())
+
+    if(orderOnly):
+        print(' '.join(ordered))
+
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
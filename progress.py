@@ -0,0 +1,125 @@
+import logging
+from time import time
+
+# users scanned between checks of the running ranking, since
+# sorting the tallies after every user would slow the scan down
+CHECK_EVERY = 100
+
+
+class ProgressivePost(object):
+
+
+    def __init__(self, submit, edit, render, firstPost, editInterval, topK, topChange, maxEdits):
+        """
+        Publishes a drilldown while it's still being crawled and
+        keeps the post up to date. Give it a function that submits
+        text and returns the post, a function that takes the post
+        and new text, and a function that takes the number of users
+        scanned and the total and returns the partial text along
+        with the ranked list of overlapping subreddits. The post
+        goes up once firstPost users are scanned. After that it's
+        edited every editInterval seconds, or sooner if at least
+        topChange of the top topK subreddits changed, but never
+        more than maxEdits times before the final edit.
+        """
+
+        self.submit = submit
+        self.edit = edit
+        self.render = render
+
+        self.firstPost = firstPost
+        self.editInterval = editInterval
+        self.topK = topK
+        self.topChange = topChange
+        self.maxEdits = maxEdits
+
+        self.post = None
+        self.edits = 0
+        self.lastEdit = 0
+        self.lastCheck = 0
+
+        # top subreddits as of the last time the post was updated
+        self.top = []
+
+
+    def update(self, scanned, total):
+        """
+        Called after each user is scanned. Submits or edits the
+        post when it's due. Give it the number of users scanned so
+        far and the number of users in the drilldown.
+        """
+
+        if self.post is None:
+            if scanned < self.firstPost and scanned < total:
+                return
+
+            # a submit that failed is tried again after a full
+            # interval, the same as an edit
+            if self.lastEdit > 0 and time() - self.lastEdit < self.editInterval:
+                return
+
+            self.lastCheck = scanned
+            self.publish(scanned, total)
+
+            return
+
+        if self.edits >= self.maxEdits:
+            return
+
+        due = time() - self.lastEdit >= self.editInterval
+
+        if not(due) and scanned - self.lastCheck < CHECK_EVERY:
+            return
+
+        self.lastCheck = scanned
+
+        text, ranking = self.render(scanned, total)
+        top = ranking[:self.topK]
+
+        if(due) or len(set(top) - set(self.top)) >= self.topChange:
+            self.publish(scanned, total, text, top)
+
+
+    def publish(self, scanned, total, text=None, top=None):
+        """
+        Submits the post, or edits it if it's already up, with the
+        partial results. A failed attempt is logged and the crawl
+        carries on.
+        """
+
+        if text is None:
+            text, ranking = self.render(scanned, total)
+            top = ranking[:self.topK]
+
+        try:
+            if self.post is None:
+                print("\nSubmitting partial post...")
+                self.post = self.submit(text)
+
+            else:
+                self.edit(self.post, text)
+                self.edits += 1
+
+        except Exception as e:
+            print('\n' + str(e))
+            logging.error("Failed to update partial post. " + str(e) + "\n\n")
+
+        # wait a full interval before trying again either way
+        self.lastEdit = time()
+        self.top = top
+
+
+    def finish(self, text):
+        """
+        Replaces the partial results with the finished drilldown.
+        Returns the post, or None if nothing was published yet, in
+        which case it should be submitted the usual way.
+        """
+
+        if self.post is None:
+            return None
+
+        print("Updating post with the final drilldown...")
+        self.edit(self.post, text)
+
+        return self.post
@@ -0,0 +1,76 @@
+import sqlite3 as db
+from time import time
+
+
+class AccountRegistry(object):
+
+
+    def __init__(self, registryFile, statusTTL):
+        """
+        Opens the registry of accounts that aren't worth crawling.
+        It takes the path of the registry's database file and the
+        number of days a recorded status stays valid. Statuses that
+        haven't expired are kept in memory so looking a user up
+        doesn't touch the disk.
+        """
+
+        self.statusTTL = statusTTL * 86400
+
+        self.con = db.connect(registryFile, timeout=60)
+        cur = self.con.cursor()
+
+        cur.execute("CREATE TABLE IF NOT EXISTS account(User TEXT PRIMARY KEY, Status TEXT, Checked REAL)")
+
+        # drop anything that has expired since the last run
+        cur.execute("DELETE FROM account WHERE Checked<?", (time() - self.statusTTL,))
+        self.con.commit()
+
+        self.statuses = {}
+
+        cur.execute("SELECT User, Status, Checked FROM account")
+
+        for user, status, checked in cur:
+            self.statuses[user] = (status, checked)
+
+
+    def status(self, user):
+        """
+        Returns the recorded status of a user, which is
+        "shadowbanned" for accounts that are deleted or
+        shadowbanned, "suspended" or "bot", or None if nothing is
+        known about them or the status has expired.
+        """
+
+        try:
+            status, checked = self.statuses[user]
+
+        except KeyError:
+            return None
+
+        if time() - checked > self.statusTTL:
+            del self.statuses[user]
+            return None
+
+        return status
+
+
+    def record(self, user, status):
+        """
+        Records the status of a user so that later drilldowns
+        can skip them.
+        """
+
+        checked = time()
+        self.statuses[user] = (status, checked)
+
+        cur = self.con.cursor()
+        cur.execute("INSERT OR REPLACE INTO account VALUES(?, ?, ?)", (user, status, checked))
+        self.con.commit()
+
+
+    def close(self):
+        """
+        Closes the registry's database file.
+        """
+
+        self.con.close()
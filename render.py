@@ -0,0 +1,270 @@
+from math import sqrt
+import operator
+import os
+import sqlite3 as db
+
+
+def drilldown_path(subreddit, window=0):
+    """
+    Returns the file a drilldown is stored in. Drilldowns that
+    only count the last window days of each user's history are
+    kept apart from the all-time ones, as <subreddit>.<N>d.db.
+    """
+
+    if window > 0:
+        return "subreddits/{0}.{1}d.db".format(subreddit, window)
+
+    return "subreddits/{0}.db".format(subreddit)
+
+
+def is_windowed(path):
+    """
+    Returns True if a file in subreddits/ holds a windowed
+    drilldown. Subreddit names can't have dots in them.
+    """
+
+    return '.' in os.path.basename(path)[:-3]
+
+
+def read_drilldown(subreddit, window=0):
+    """
+    Reads a stored drilldown from subreddits/. Give it the
+    subreddit the drilldown is for and optionally its window in
+    days. Returns the number of users found and the list of
+    (subreddit, overlapping users) rows in the order they were
+    stored, or None if there's no drilldown.
+    """
+
+    dbFile = drilldown_path(subreddit, window)
+
+    if not(os.path.isfile(dbFile)):
+        return None
+
+    con = db.connect(dbFile)
+    cur = con.cursor()
+
+    cur.execute("SELECT * FROM drilldown")
+    rows = cur.fetchall()
+
+    con.close()
+
+    userCount = 0
+
+    for sub, users in rows:
+        if sub == subreddit:
+            userCount = users
+
+    return (userCount, rows)
+
+
+def read_fidelity(subreddit, window=0):
+    """
+    Returns the fidelity a subreddit's stored drilldown was made
+    with: "full", or "reduced" for a counterpart drilldown made
+    with the smaller tiered budget. Drilldowns from before the
+    tag existed count as full. Returns None if there's no
+    drilldown.
+    """
+
+    dbFile = drilldown_path(subreddit, window)
+
+    if not(os.path.isfile(dbFile)):
+        return None
+
+    con = db.connect(dbFile)
+    cur = con.cursor()
+
+    try:
+        cur.execute("SELECT value FROM meta WHERE key='fidelity'")
+        row = cur.fetchone()
+
+    except db.OperationalError:
+        row = None
+
+    con.close()
+
+    if row is None:
+        return "full"
+
+    return row[0]
+
+
+def similarity_from_cache(subreddit1, subreddit2, window=0):
+    """
+    Calculates the similarity between two subreddits from their
+    stored drilldowns. Give it the two subreddits to compare and
+    optionally the window of the drilldowns to use. Returns the
+    similarity, or None if either drilldown is missing or doesn't
+    hold enough to work it out.
+    """
+
+    dbFile1 = drilldown_path(subreddit1, window)
+    dbFile2 = drilldown_path(subreddit2, window)
+
+    # Query statements need strings fed in tuples
+    sub1 = (subreddit1,)
+    sub2 = (subreddit2,)
+
+    # so these are defined in case that sub1 or sub2 don't
+    # show up in the drilldown for one of them they can be
+    # set equal to each other so the program can calculate the
+    # similarity between the 2 subreddits.
+    AB = None
+    BA = None
+    A = None
+    B = None
+
+    for path in [dbFile1, dbFile2]:
+        if not(os.path.isfile(path)):
+            return None
+
+    # open the database for subreddit 1
+    con1 = db.connect(dbFile1)
+    cur1 = con1.cursor()
+
+    # get the number of overlapping users from subreddit2
+    cur1.execute("SELECT users FROM drilldown WHERE overlaps=?", sub2)
+
+    for overlap in cur1:
+        AB = operator.getitem(overlap, 0)
+
+    # get the total number of users found in subreddit2
+    cur1.execute("SELECT users FROM drilldown WHERE overlaps=?", sub1)
+
+    for userCount in cur1:
+        A = operator.getitem(userCount, 0)
+
+    # close subreddit1's database file
+    con1.close()
+
+    # open the database for subreddit2
+    con2 = db.connect(dbFile2)
+    cur2 = con2.cursor()
+
+    # do the same thing for subreddit1 and was done for subreddit2
+    cur2.execute("SELECT users FROM drilldown WHERE overlaps=?", sub1)
+
+    for overlap in cur2:
+        BA = operator.getitem(overlap, 0)
+
+    if AB is None:
+        AB = BA
+
+    if BA is None:
+        BA = AB
+
+    cur2.execute("SELECT users FROM drilldown WHERE overlaps=?", sub2)
+
+    for userCount in cur2:
+        B = operator.getitem(userCount, 0)
+
+    con2.close()
+
+    if AB is None or A is None or B is None:
+        return None
+
+    try:
+        # use the retrieved data to calculate similarity
+        return float("{0:.05f}".format((sqrt(AB * BA)) / (sqrt(float(A * B)))))
+
+    except ZeroDivisionError:
+        return float(0.00000)
+
+
+def collect_similarities(subreddit, rows, banList, similarityLimit, similarity):
+    """
+    Works out the similarity between a subreddit and the ones it
+    overlaps with, in the order of its drilldown, until
+    similarityLimit of them have been found. Give it the subreddit,
+    its drilldown rows, the banlist, the limit and a function that
+    takes two subreddits and returns a (subreddit, similarity)
+    tuple, or None to skip that subreddit. Returns the list of
+    tuples sorted by similarity.
+    """
+
+    simList = []
+
+    for row in rows:
+        subreddit2 = operator.getitem(row, 0)
+
+        if subreddit2 == subreddit:
+            continue
+
+        if subreddit2 not in banList:
+
+            if len(simList) == similarityLimit:
+                break
+
+            result = similarity(subreddit, subreddit2)
+
+            if result is not None:
+                simList.append(result)
+
+    simList.sort(key=operator.itemgetter(1), reverse=True)
+
+    return simList
+
+
+def format_drilldown(subreddit, userCount, rows, banList, simList=None, reduced=(), window=0):
+    """
+    Formats a drilldown as the text of a Reddit post. Give it the
+    subreddit the drilldown is for, the number of users found, the
+    drilldown rows, the banlist and optionally the sorted list of
+    similarity tuples to put in a table at the top, along with the
+    subreddits whose similarity came from a reduced-fidelity
+    drilldown, and the window of the drilldown in days. Returns
+    the formatted string.
+    """
+
+    bodyContent = ""
+
+    # make a table
+    if window > 0:
+        bodyStart = "## /r/{0} Drilldown (last {1} days)\n\n".format(subreddit, window)
+
+    else:
+        bodyStart = "## /r/{0} Drilldown\n\n".format(subreddit)
+
+    if simList is not None:
+        bodyStart += "| Subreddit | Similarity |\n"
+        bodyStart += "|:------|------:|\n"
+
+        marked = False
+
+        # fill in the table
+        for element in simList:
+            sub = operator.getitem(element, 0)
+            sim = operator.getitem(element, 1)
+
+            if sub in reduced:
+                bodyContent += "|/r/{0}\\*|{1}|\n".format(sub, sim)
+                marked = True
+
+            else:
+                bodyContent += "|/r/{0}|{1}|\n".format(sub, sim)
+
+            if len(bodyStart + bodyContent) >= 1000:
+                break
+
+        if(marked):
+            bodyContent += "\n\\* Similarity from a reduced-fidelity drilldown.\n"
+
+    bodyContent += "\nOf {0} Users Found:\n\n".format(userCount)
+    bodyContent += "| Subreddit | Overlapping users |\n"
+    bodyContent += "|:------|------:|\n"
+
+    for row in rows:
+        sub = operator.getitem(row, 0)
+
+        if sub == subreddit:
+            continue
+
+        if sub not in banList:
+            overlap = operator.getitem(row, 1)
+            bodyContent += "|/r/{0}|{1}|\n".format(sub, overlap)
+
+        if len(bodyStart + bodyContent) >= 14000:
+            # so the drilldown doesn't get too big to post
+            break
+
+    return bodyStart + bodyContent
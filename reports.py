@@ -0,0 +1,233 @@
+from collections import Counter
+import glob
+import operator
+import os
+import sqlite3 as db
+import sys
+from depth import OverviewDepth, PAGE_SIZE
+from histogram import drilldown_at, read_buckets
+from settings import read_config
+
+
+def read_users(userFile=None):
+    """
+    Returns the users to report on. Give it a file with user names
+    separated by commas or newlines, like the ones infoLogging
+    writes. Without one every cached user is used.
+    """
+
+    if userFile is None:
+        return sorted(os.path.basename(path)[:-3] for path in glob.glob("users/*.db"))
+
+    with open(userFile, 'r') as f:
+        users = f.read().replace('\n', ',').split(',')
+
+    return [user.strip() for user in users if user.strip()]
+
+
+def rank(counter, cutoff=5):
+    """
+    Sorts a tally the same way create_tuples() does. Returns a
+    list of (subreddit, users) tuples.
+    """
+
+    ranking = [(sub, count) for sub, count in counter.items() if count >= cutoff]
+    ranking.sort(key=operator.itemgetter(1), reverse=True)
+
+    return ranking
+
+
+def adaptive_report(config, users, topK=25):
+    """
+    Replays the cached overviews of the given users as if they had
+    been crawled in adaptive mode and prints how many requests that
+    would have saved and how much the ranking would have changed.
+    Only users whose overviews were read to full depth are used.
+    """
+
+    minScore = int(config.main.minScore)
+    overviewLimit = int(config.main.overviewLimit)
+    stalePages = int(config.main.stalePages)
+    minPages = int(config.main.minPages)
+
+    fullCounter = Counter()
+    adaptiveCounter = Counter()
+
+    fullPages = 0
+    adaptivePages = 0
+    scanned = 0
+
+    for user in users:
+        dbFile = "users/{0}.db".format(user)
+
+        if not(os.path.isfile(dbFile)):
+            continue
+
+        con = db.connect(dbFile)
+        cur = con.cursor()
+
+        try:
+            # truncated overviews can't show what a full scan finds
+            cur.execute("SELECT 1 FROM meta WHERE Key='after'")
+
+            if cur.fetchone() is not None:
+                con.close()
+                continue
+
+        except db.OperationalError:
+            pass
+
+        try:
+            cur.execute("SELECT Overlap, Score FROM user ORDER BY rowid LIMIT ?", (overviewLimit,))
+
+        except db.OperationalError:
+            con.close()
+            continue
+
+        tracker = OverviewDepth(stalePages, minPages)
+
+        fullSubs = set()
+        adaptiveSubs = set()
+        stopped = False
+        items = 0
+
+        for csubreddit, comScore in cur:
+            qualifies = int(comScore) > minScore
+            items += 1
+
+            if(qualifies):
+                fullSubs.add(csubreddit)
+
+                if not(stopped):
+                    adaptiveSubs.add(csubreddit)
+
+            if not(stopped) and tracker.add(csubreddit, qualifies):
+                stopped = True
+
+        con.close()
+
+        scanned += 1
+
+        pages = (items + PAGE_SIZE - 1) // PAGE_SIZE
+        fullPages += pages
+
+        if(stopped):
+            adaptivePages += tracker.pages
+
+        else:
+            adaptivePages += pages
+
+        fullCounter.update(fullSubs)
+        adaptiveCounter.update(adaptiveSubs)
+
+    fullRanking = rank(fullCounter)
+    adaptiveRanking = rank(adaptiveCounter)
+
+    fullTop = [sub for sub, count in fullRanking[:topK]]
+    adaptiveTop = [sub for sub, count in adaptiveRanking[:topK]]
+
+    shared = set(fullTop) & set(adaptiveTop)
+
+    # how far each shared subreddit moved in the ranking
+    shifts = [abs(fullTop.index(sub) - adaptiveTop.index(sub)) for sub in shared]
+
+    print("Users replayed: {0}".format(scanned))
+
+    if fullPages > 0:
+        print("Overview requests: {0} full, {1} adaptive ({2:.1f}% fewer)".format(
+            fullPages, adaptivePages, 100.0 * (fullPages - adaptivePages) / fullPages))
+
+    print("Subreddits ranked: {0} full, {1} adaptive".format(len(fullRanking), len(adaptiveRanking)))
+    print("Top {0} in common: {1}".format(topK, len(shared)))
+
+    if(shifts):
+        print("Rank shift in the top {0}: {1:.2f} on average, {2} at most".format(
+            topK, float(sum(shifts)) / len(shifts), max(shifts)))
+
+    lost = sum(fullCounter.values()) - sum(adaptiveCounter.values())
+    print("Overlapping users lost: {0} of {1}".format(lost, sum(fullCounter.values())))
+
+
+def sweep_report(subreddit, scores, cutoff=5, top=25):
+    """
+    Prints the drilldown of a subreddit at several minimum scores
+    side by side, worked out from its stored score histogram. Give
+    it the subreddit, a list of minimum scores, the fewest
+    overlapping users to include and how many rows to print.
+    """
+
+    dbFile = "subreddits/{0}.db".format(subreddit)
+
+    if not(os.path.isfile(dbFile)):
+        print("No drilldown stored for /r/{0}.".format(subreddit))
+        return
+
+    con = db.connect(dbFile)
+    cur = con.cursor()
+
+    buckets = read_buckets(cur)
+
+    if len(buckets) == 0:
+        print("/r/{0} was stored without a score histogram.".format(subreddit))
+        con.close()
+        return
+
+    for minScore in scores:
+        subredditTuple = drilldown_at(cur, subreddit, minScore, cutoff)
+
+        if subredditTuple is None:
+            print("\nminScore {0} isn't a bucket edge. Stored edges: {1}".format(
+                minScore, ", ".join(str(edge) for edge in buckets)))
+            continue
+
+        print("\n/r/{0} with minScore = {1}: {2} subreddits\n".format(subreddit, minScore, len(subredditTuple)))
+        print("| Subreddit | Overlapping users |")
+        print("|:------|------:|")
+
+        for subName, users in subredditTuple[:top]:
+            print("|/r/{0}|{1}|".format(subName, users))
+
+    con.close()
+
+
+def main():
+    """
+    Offline reports over the cached data. Usage:
+
+        python reports.py adaptive [userfile]
+        python reports.py sweep <subreddit> <minScore,minScore,...> [cutoff]
+    """
+
+    args = sys.argv[1:]
+
+    if len(args) == 0:
+        print(main.__doc__)
+        sys.exit(1)
+
+    config = read_config()
+
+    if args[0] == "adaptive":
+        if len(args) > 1:
+            users = read_users(args[1])
+
+        else:
+            users = read_users()
+
+        adaptive_report(config, users)
+
+    elif args[0] == "sweep" and len(args) > 2:
+        scores = [int(score) for score in args[2].split(',')]
+
+        if len(args) > 3:
+            sweep_report(args[1], scores, int(args[3]))
+
+        else:
+            sweep_report(args[1], scores)
+
+    else:
+        print(main.__doc__)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
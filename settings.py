@@ -0,0 +1,29 @@
+import os
+from simpleconfigparser import simpleconfigparser
+
+
+def read_config():
+    """
+    Reads settings.cfg without logging in or importing praw.
+    """
+
+    config = simpleconfigparser()
+    config.read("settings.cfg")
+
+    return config
+
+
+def read_banlist(config):
+    """
+    Returns the banlist if it's turned on, like SubredditAnalysis
+    does.
+    """
+
+    banList = []
+
+    if(config.main.getboolean("banList")) and os.path.isfile("banlist.txt"):
+        with open("banlist.txt", 'r') as f:
+            for subreddit in f.readlines():
+                banList.append(subreddit.strip('\n'))
+
+    return banList
@@ -10,6 +10,7 @@ config = {
 	'download_url': 'https://github.com/SirNeon618/SubredditAnalysis/archive/master.zip',
 	'version': '1.1',
 	'install_requires': ['praw', 'requests', 'simpleconfigparser'],
+	'extras_require': {'index': ['numpy']},
 	'packages': [],
 	'scripts': [],
 	'name': 'SubredditAnalysis'
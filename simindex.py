@@ -0,0 +1,305 @@
+from hashlib import md5
+import glob
+import os
+import sqlite3 as db
+from sqlite3 import OperationalError
+import sys
+from time import time
+from render import drilldown_path, is_windowed
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class SimilarityIndex(object):
+
+
+    def __init__(self, indexFile, dims):
+        """
+        Holds a normalized overlap vector for every stored drilldown
+        so the most similar subreddits can be found for any of them
+        at once. Each overlapping subreddit is hashed into one of
+        dims columns, which keeps the vectors the same width no
+        matter how many subreddits show up. Only the nonzero columns
+        of each vector are stored, one row per drilldown, so adding
+        a drilldown only writes its own row. Give it the path of the
+        index file and the number of columns. Needs numpy.
+        """
+
+        if numpy is None:
+            raise ImportError("The similarity index needs numpy. Run: pip install numpy")
+
+        self.indexFile = indexFile
+        self.dims = dims
+
+        self.con = db.connect(self.indexFile)
+        cur = self.con.cursor()
+
+        cur.execute("CREATE TABLE IF NOT EXISTS meta(Key TEXT PRIMARY KEY, Value TEXT)")
+        cur.execute("CREATE TABLE IF NOT EXISTS vector(Key TEXT PRIMARY KEY, Name TEXT, Columns BLOB, Weights BLOB)")
+
+        cur.execute("SELECT Value FROM meta WHERE Key='dims'")
+        row = cur.fetchone()
+
+        # an index built with a different width is useless
+        if row is None or int(row[0]) != dims:
+            cur.execute("DELETE FROM vector")
+            cur.execute("INSERT OR REPLACE INTO meta VALUES('dims', ?)", (str(dims),))
+
+        self.con.commit()
+
+
+    def column(self, subreddit):
+        """
+        Returns the column a subreddit is hashed into. The hash is
+        the same in every process so stored indexes stay valid.
+        """
+
+        return int(md5(subreddit.lower().encode("utf-8")).hexdigest(), 16) % self.dims
+
+
+    def vector(self, subreddit):
+        """
+        Reads a drilldown from subreddits/ and turns it into a unit
+        vector of the share of its users that overlap with each
+        subreddit. Returns None if there's no usable drilldown.
+        """
+
+        dbFile = drilldown_path(subreddit)
+
+        if not(os.path.isfile(dbFile)):
+            return None
+
+        con = db.connect(dbFile)
+        cur = con.cursor()
+
+        try:
+            cur.execute("SELECT overlaps, users FROM drilldown")
+            rows = cur.fetchall()
+
+        except OperationalError:
+            con.close()
+            return None
+
+        con.close()
+
+        vector = numpy.zeros(self.dims, dtype=numpy.float32)
+        userCount = 0
+
+        for subName, users in rows:
+            if subName == subreddit:
+                userCount = users
+                continue
+
+            vector[self.column(subName)] += users
+
+        if userCount > 0:
+            vector /= userCount
+
+        length = numpy.linalg.norm(vector)
+
+        if length == 0:
+            return None
+
+        return vector / length
+
+
+    def store(self, subreddit, vector):
+        """
+        Writes the nonzero columns of a drilldown's vector to its
+        row, replacing the row that's already there.
+        """
+
+        columns = numpy.flatnonzero(vector).astype(numpy.int32)
+        weights = vector[columns].astype(numpy.float32)
+
+        self.con.execute(
+            "INSERT OR REPLACE INTO vector VALUES(?, ?, ?, ?)",
+            (subreddit.lower(), subreddit, columns.tobytes(), weights.tobytes())
+        )
+
+
+    def add(self, subreddit):
+        """
+        Adds a drilldown to the index or replaces the one that's
+        already in it. Returns True if it was added.
+        """
+
+        vector = self.vector(subreddit)
+
+        if vector is None:
+            return False
+
+        self.store(subreddit, vector)
+
+        return True
+
+
+    def rebuild(self):
+        """
+        Throws the index away and builds it again from every
+        drilldown in subreddits/.
+        """
+
+        self.con.execute("DELETE FROM vector")
+
+        for path in sorted(glob.glob("subreddits/*.db")):
+            # only all-time drilldowns are indexed
+            if(is_windowed(path)):
+                continue
+
+            subreddit = os.path.basename(path)[:-3]
+            vector = self.vector(subreddit)
+
+            if vector is None:
+                continue
+
+            self.store(subreddit, vector)
+
+
+    def save(self):
+        """
+        Commits the rows written since the last save.
+        """
+
+        self.con.commit()
+
+
+    def size(self):
+        """
+        Returns how many drilldowns are indexed.
+        """
+
+        cur = self.con.cursor()
+        cur.execute("SELECT COUNT(*) FROM vector")
+
+        return cur.fetchone()[0]
+
+
+    def query(self, subreddit, k=10):
+        """
+        Finds the k indexed subreddits most similar to the given
+        one by cosine similarity of their overlap vectors. The
+        subreddit doesn't have to be indexed as long as it has a
+        drilldown. Returns a list of (subreddit, similarity)
+        tuples, most similar first.
+        """
+
+        vector = None
+
+        names = []
+        rows = []
+        columns = []
+        weights = []
+
+        cur = self.con.cursor()
+        cur.execute("SELECT Key, Name, Columns, Weights FROM vector")
+
+        for key, name, rowColumns, rowWeights in cur:
+            rowColumns = numpy.frombuffer(rowColumns, dtype=numpy.int32)
+
+            # the subreddit itself is left out of the results
+            if key == subreddit.lower():
+                vector = numpy.zeros(self.dims, dtype=numpy.float32)
+                vector[rowColumns] = numpy.frombuffer(rowWeights, dtype=numpy.float32)
+                continue
+
+            rows.append(numpy.full(len(rowColumns), len(names), dtype=numpy.int32))
+            columns.append(rowColumns)
+            weights.append(numpy.frombuffer(rowWeights, dtype=numpy.float32))
+            names.append(name)
+
+        # it doesn't have to be indexed as long as it has a drilldown
+        if vector is None:
+            vector = self.vector(subreddit)
+
+            if vector is None:
+                return []
+
+        k = min(k, len(names))
+
+        if k <= 0:
+            return []
+
+        columns = numpy.concatenate(columns)
+
+        # sums each row's weights times the matching columns of
+        # the vector, which is the dot product of the sparse rows
+        scores = numpy.bincount(
+            numpy.concatenate(rows),
+            weights=numpy.concatenate(weights) * vector[columns],
+            minlength=len(names)
+        )
+
+        # only sort the k best instead of the whole corpus
+        best = numpy.argpartition(-scores, k - 1)[:k]
+        best = best[numpy.argsort(-scores[best])]
+
+        return [(names[i], float("{0:.05f}".format(scores[i]))) for i in best]
+
+
+    def close(self):
+        """
+        Closes the index file.
+        """
+
+        self.con.close()
+
+
+def main():
+    """
+    Builds and queries the similarity index. Usage:
+
+        python simindex.py rebuild
+        python simindex.py query <subreddit> [k]
+    """
+
+    from settings import read_config
+
+    config = read_config()
+
+    index = SimilarityIndex(config.index.indexFile, int(config.index.dims))
+
+    args = sys.argv[1:]
+
+    if len(args) == 1 and args[0] == "rebuild":
+        start = time()
+        index.rebuild()
+        index.save()
+
+        print("Indexed {0} drilldowns in {1:.2f} seconds.".format(index.size(), time() - start))
+
+    elif len(args) in [2, 3] and args[0] == "query":
+        if len(args) == 3:
+            k = int(args[2])
+
+        else:
+            k = 10
+
+        start = time()
+        results = index.query(args[1], k)
+        elapsed = time() - start
+
+        if len(results) == 0:
+            print("No drilldown found for /r/{0}.".format(args[1]))
+            sys.exit(1)
+
+        print("| Subreddit | Similarity |")
+        print("|:------|------:|")
+
+        for subName, similarity in results:
+            print("|/r/{0}|{1}|".format(subName, similarity))
+
+        print("\nSearched {0} drilldowns in {1:.1f} ms.".format(index.size(), elapsed * 1000))
+
+    else:
+        print(main.__doc__)
+        sys.exit(1)
+
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
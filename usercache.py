@@ -0,0 +1,213 @@
+from collections import OrderedDict
+import operator
+import os
+import sqlite3 as db
+from sqlite3 import OperationalError
+from time import time
+
+
+def ensure_aggregate(cur, minScore):
+    """
+    Makes sure a user's database file has the aggregate table,
+    which keeps one row per subreddit with the number of items,
+    the highest score, the row of the first item and the row of
+    the first item scoring above minScore. Files written before
+    the table existed get it built from their stored items, and
+    the first rows above minScore are worked out again when
+    minScore changed since. Give it the cursor of the user's file
+    and the minimum score.
+    """
+
+    try:
+        cur.execute("SELECT 1 FROM aggregate LIMIT 1")
+
+    except OperationalError:
+        cur.execute("CREATE TABLE aggregate(Overlap TEXT PRIMARY KEY, Items INT, MaxScore INT, First INT, Qualified INT)")
+        cur.execute("INSERT INTO aggregate SELECT Overlap, COUNT(*), MAX(Score), MIN(rowid), NULL FROM user GROUP BY Overlap")
+
+    try:
+        cur.execute("SELECT Qualified FROM aggregate LIMIT 1")
+
+    # built before the first rows above minScore were kept
+    except OperationalError:
+        cur.execute("ALTER TABLE aggregate ADD COLUMN Qualified INT")
+
+    cur.execute("CREATE TABLE IF NOT EXISTS meta(Key TEXT PRIMARY KEY, Value TEXT)")
+    cur.execute("SELECT Value FROM meta WHERE Key='minScore'")
+    row = cur.fetchone()
+
+    if row is None or int(operator.getitem(row, 0)) != minScore:
+        cur.execute("SELECT Overlap, MIN(rowid) FROM user WHERE Score>? GROUP BY Overlap", (minScore,))
+        qualified = cur.fetchall()
+
+        cur.execute("UPDATE aggregate SET Qualified=NULL")
+        cur.executemany("UPDATE aggregate SET Qualified=? WHERE Overlap=?", [(rowID, sub) for sub, rowID in qualified])
+        cur.execute("INSERT OR REPLACE INTO meta VALUES('minScore', ?)", (str(minScore),))
+
+
+def ensure_created(cur):
+    """
+    Makes sure a user's database file stores when each item was
+    posted, with an index so the items of a time window can be
+    looked up without reading the rest. Items stored before the
+    column existed have no date and only count towards
+    all-time drilldowns. Give it the cursor of the user's file.
+    """
+
+    try:
+        cur.execute("SELECT Created FROM user LIMIT 1")
+
+    except OperationalError:
+        cur.execute("ALTER TABLE user ADD COLUMN Created REAL")
+
+    cur.execute("CREATE INDEX IF NOT EXISTS user_created ON user(Created)")
+
+
+def read_scores(cur, minScore, window=0):
+    """
+    Reads the best score a user has in each subreddit. The
+    subreddits come in the order their first item above minScore
+    was found, which is the order a scan adds them to the
+    drilldown in, followed by the ones without such an item. With
+    a window in days, only the items posted in that many days back
+    count. Give it the cursor of the user's file, which has to be
+    through ensure_aggregate() with the same minScore. Returns an
+    OrderedDict of subreddit to best score.
+    """
+
+    if window > 0:
+        cur.execute(
+            "SELECT Overlap, MAX(Score), MIN(CASE WHEN Score>? THEN rowid END) AS Qualified FROM user "
+            "WHERE Created>=? GROUP BY Overlap ORDER BY Qualified IS NULL, Qualified, MIN(rowid)",
+            (minScore, time() - window * 86400)
+        )
+
+    else:
+        # one row per subreddit instead of one per item
+        cur.execute("SELECT Overlap, MaxScore FROM aggregate ORDER BY Qualified IS NULL, Qualified, First")
+
+    scores = OrderedDict()
+
+    for row in cur.fetchall():
+        scores[operator.getitem(row, 0)] = int(operator.getitem(row, 1))
+
+    return scores
+
+
+def get_truncation(cur):
+    """
+    Checks whether a user's database file holds a truncated
+    overview. Give it the cursor of the file. Returns the
+    fullname of the last stored item and how many items are
+    stored, or None and 0 if the overview is complete.
+    """
+
+    try:
+        cur.execute("SELECT Key, Value FROM meta WHERE Key IN ('after', 'depth')")
+
+    except OperationalError:
+        return (None, 0)
+
+    meta = dict(cur.fetchall())
+
+    if "after" not in meta:
+        return (None, 0)
+
+    return (meta["after"], int(meta["depth"]))
+
+
+def needs_dates(cur):
+    """
+    Checks whether a user's database file holds items stored
+    before dates were kept that haven't been backfilled yet. Give
+    it the cursor of the file. Returns True if it does.
+    """
+
+    try:
+        cur.execute("SELECT 1 FROM meta WHERE Key='dated'")
+
+        if cur.fetchone() is not None:
+            return False
+
+    except OperationalError:
+        pass
+
+    cur.execute("SELECT 1 FROM user WHERE Created IS NULL LIMIT 1")
+
+    return cur.fetchone() is not None
+
+
+def count_undated(cur):
+    """
+    Returns how many of a user's stored items have no date. Give
+    it the cursor of the user's file.
+    """
+
+    cur.execute("SELECT COUNT(*) FROM user WHERE Created IS NULL")
+
+    return cur.fetchone()[0]
+
+
+def read_cached(user, minScore, window, overviewLimit, continueTruncated):
+    """
+    Reads a user's subreddits from their cached database file
+    without touching the network. Give it the name of the user,
+    the minimum score, the window in days, the overview limit and
+    whether truncated overviews would be continued. Returns a list of (subreddit,
+    best score) pairs, or None if the user has to go through
+    SubredditAnalysis.scan_user() instead, either because the
+    file is unreadable, because its overview needs continuing or
+    because a windowed read has undated items to backfill or
+    count.
+    """
+
+    con = db.connect("users/{0}.db".format(user))
+    cur = con.cursor()
+
+    try:
+        ensure_aggregate(cur, minScore)
+        ensure_created(cur)
+        con.commit()
+
+        if(continueTruncated):
+            after, depth = get_truncation(cur)
+
+            if after is not None and depth < overviewLimit:
+                con.close()
+                return None
+
+        # scan_user() backfills and counts undated items
+        if window > 0 and count_undated(cur) > 0:
+            con.close()
+            return None
+
+        scores = read_scores(cur, minScore, window)
+
+    except OperationalError:
+        con.close()
+        return None
+
+    con.close()
+
+    return list(scores.items())
+
+
+def scan_cached(job):
+    """
+    Process pool worker that reads a batch of cached users. Give
+    it a (users, minScore, window, overviewLimit, continueTruncated)
+    tuple. Returns the result of read_cached() for each user, in
+    order.
+    """
+
+    users, minScore, window, overviewLimit, continueTruncated = job
+
+    return [read_cached(user, minScore, window, overviewLimit, continueTruncated) for user in users]
+
+
+def is_cached(user):
+    """
+    Returns True if a user's overview is in the cache.
+    """
+
+    return os.path.isfile("users/{0}.db".format(user))
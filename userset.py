@@ -0,0 +1,230 @@
+from array import array
+from hashlib import md5
+import os
+import sqlite3 as db
+from struct import unpack
+
+
+def current_rss():
+    """
+    Returns the resident set size of this process in megabytes.
+    Reads /proc where it exists and falls back on the peak size
+    reported by the resource module elsewhere.
+    """
+
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            pages = int(f.read().split()[1])
+
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1048576.0
+
+    except (IOError, OSError, ValueError):
+        import resource
+
+        # kilobytes on Linux, bytes on OS X
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        if peak > 1 << 32:
+            return peak / 1048576.0
+
+        return peak / 1024.0
+
+
+class UserSet(object):
+
+
+    def __init__(self, spillFile, maxRSS):
+        """
+        A set of user names that remembers the order they were
+        added in. It can stand in for the plain list that
+        get_users() builds. In memory the names are kept as one
+        block of UTF-8 text in the order they were added, and the
+        lookups go through a table of 64-bit hashes of the names,
+        which takes a fraction of the memory a list of strings
+        does. Two names sharing a hash is too unlikely to matter
+        at the number of users a drilldown has. If the process
+        grows past maxRSS megabytes anyway, every name is moved
+        into spillFile and later names go straight to disk.
+        """
+
+        self.spillFile = spillFile
+        self.maxRSS = maxRSS
+
+        # every name followed by a newline, which usernames can't
+        # contain, after a leading newline so a name can be found
+        # along with the newlines around it
+        self.names = bytearray(b"\n")
+
+        # open addressing table of name hashes, 0 marks a free slot
+        self.slots = array("Q", [0]) * 1024
+
+        self.con = None
+        self.count = 0
+
+        # left over from a run that didn't get to close its set
+        if(os.path.isfile(self.spillFile)):
+            os.remove(self.spillFile)
+
+
+    def hash_of(self, name):
+        """
+        Returns the nonzero 64-bit hash of an encoded name.
+        """
+
+        key = unpack("<Q", md5(name).digest()[:8])[0]
+
+        return key or 1
+
+
+    def find_slot(self, key):
+        """
+        Returns the slot that holds a hash, or the free slot it
+        would go in.
+        """
+
+        mask = len(self.slots) - 1
+        i = key & mask
+
+        while self.slots[i] != 0 and self.slots[i] != key:
+            i = (i + 1) & mask
+
+        return i
+
+
+    def rebuild(self, size):
+        """
+        Puts the hashes of the names in memory into a new table
+        of the given size, a power of 2.
+        """
+
+        self.slots = array("Q", [0]) * size
+
+        for name in bytes(self.names).split(b"\n"):
+            if name:
+                key = self.hash_of(name)
+                self.slots[self.find_slot(key)] = key
+
+
+    def spill(self):
+        """
+        Moves every name held in memory into the spill file.
+        """
+
+        # read before the set switches over to the file
+        users = iter(self)
+
+        self.con = db.connect(self.spillFile)
+        cur = self.con.cursor()
+
+        cur.execute("CREATE TABLE IF NOT EXISTS user(Name TEXT PRIMARY KEY)")
+        cur.executemany("INSERT OR IGNORE INTO user VALUES(?)", ((user,) for user in users))
+
+        self.con.commit()
+
+        self.names = bytearray(b"\n")
+        self.slots = array("Q", [0])
+
+
+    def check_memory(self):
+        """
+        Spills the names to disk if the process has grown past
+        its memory ceiling. Returns True if the names are on disk.
+        """
+
+        if self.con is None and self.maxRSS > 0 and current_rss() > self.maxRSS:
+            print("\nMemory ceiling reached, moving users to {0}...".format(self.spillFile))
+            self.spill()
+
+        return self.con is not None
+
+
+    def append(self, user):
+        """
+        Adds a user if they aren't in the set already.
+        """
+
+        if self.con is None:
+            name = user.encode("utf-8")
+            key = self.hash_of(name)
+            i = self.find_slot(key)
+
+            if self.slots[i] == 0:
+                self.slots[i] = key
+                self.names.extend(name + b"\n")
+                self.count += 1
+
+                # keep the table at most half full
+                if self.count * 2 > len(self.slots):
+                    self.rebuild(len(self.slots) * 2)
+
+        else:
+            cur = self.con.cursor()
+            cur.execute("INSERT OR IGNORE INTO user VALUES(?)", (user,))
+            self.count += cur.rowcount
+
+
+    def remove(self, user):
+        """
+        Takes a user back out of the set.
+        """
+
+        if self.con is None:
+            if user in self:
+                name = user.encode("utf-8")
+                start = self.names.find(b"\n" + name + b"\n")
+
+                del self.names[start + 1:start + len(name) + 2]
+                self.count -= 1
+
+                # open addressing can't just clear the slot
+                self.rebuild(len(self.slots))
+
+        else:
+            cur = self.con.cursor()
+            cur.execute("DELETE FROM user WHERE Name=?", (user,))
+            self.count -= cur.rowcount
+
+
+    def __contains__(self, user):
+        if self.con is None:
+            key = self.hash_of(user.encode("utf-8"))
+
+            return self.slots[self.find_slot(key)] != 0
+
+        cur = self.con.cursor()
+        cur.execute("SELECT 1 FROM user WHERE Name=?", (user,))
+
+        return cur.fetchone() is not None
+
+
+    def __len__(self):
+        return self.count
+
+
+    def __iter__(self):
+        if self.con is None:
+            return (name.decode("utf-8") for name in bytes(self.names).split(b"\n") if name)
+
+        self.con.commit()
+
+        cur = self.con.cursor()
+        cur.execute("SELECT Name FROM user ORDER BY rowid")
+
+        return (row[0] for row in cur)
+
+
+    def close(self):
+        """
+        Closes the spill file and removes it. The file has to be
+        closed first, since an open file can't be removed on
+        Windows.
+        """
+
+        if self.con is not None:
+            self.con.close()
+            self.con = None
+
+            os.remove(self.spillFile)
+
+        self.names = bytearray(b"\n")
+        self.slots = array("Q", [0]) * 1024
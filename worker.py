@@ -0,0 +1,80 @@
+import logging
+import os
+from socket import timeout
+import sys
+from time import sleep
+from praw.errors import *
+from requests.exceptions import HTTPError
+from crawler import SubredditAnalysis
+from exceptions import *
+from workqueue import WorkQueue
+
+
+def main():
+    """
+    Runs a worker that scans users from the shared work queue
+    for whichever drilldown is currently in progress. Pass
+    --shard N to only take users from one shard and --once to
+    exit when the queue runs dry instead of waiting for the
+    next drilldown.
+    """
+
+    shard = None
+    once = False
+
+    args = sys.argv[1:]
+
+    if "--shard" in args:
+        shard = int(args[args.index("--shard") + 1])
+
+    if "--once" in args:
+        once = True
+
+    workerName = "{0}-{1}".format(os.uname()[1], os.getpid())
+
+    username = myBot.config.login.username
+    password = myBot.config.login.password
+
+    try:
+        myBot.login(username, password)
+
+    except (InvalidUser, InvalidUserPass, RateLimitExceeded, APIException,
+            ConnectionResetError, HTTPError, timeout) as e:
+        myBot.add_msg(e)
+        logging.error(str(e) + "\n\n")
+        sys.exit(1)
+
+    if not(os.path.isdir("users")):
+        os.mkdir("users")
+
+    queue = WorkQueue(myBot.queueFile, myBot.shards, myBot.leaseTime, myBot.maxAttempts)
+
+    print("Worker {0} waiting for work...".format(workerName))
+
+    while True:
+        job = queue.open_job()
+
+        if job is not None:
+            myBot.run_worker(queue, job, workerName, shard)
+
+        if(once):
+            break
+
+        sleep(myBot.pollInterval)
+
+    queue.close()
+
+
+if __name__ == "__main__":
+    myBot = SubredditAnalysis()
+
+    if(myBot.errorLogging):
+        logging.basicConfig(
+            filename="SubredditAnalysis_logerr.log",
+            filemode='a', format="%(asctime)s\nIn "
+            "%(filename)s (%(funcName)s:%(lineno)s): "
+            "%(message)s", datefmt="%Y-%m-%d %H:%M:%S",
+            level=logging.ERROR
+        )
+
+    main()
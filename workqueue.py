@@ -0,0 +1,227 @@
+from hashlib import md5
+import json
+import sqlite3 as db
+from time import time
+
+
+class WorkQueue(object):
+
+
+    def __init__(self, queueFile, shards=1, leaseTime=600, maxAttempts=3):
+        """
+        Opens the work queue that is shared between the workers.
+        It takes the path of the queue's database file, the number
+        of shards that users get hashed into, how many seconds a
+        lease lasts and how many times a user can be leased before
+        the queue gives up on them.
+        """
+
+        self.shards = shards
+        self.leaseTime = leaseTime
+        self.maxAttempts = maxAttempts
+
+        # several processes write to this file, so wait
+        # on their locks instead of failing right away
+        self.con = db.connect(queueFile, timeout=60, isolation_level=None)
+        cur = self.con.cursor()
+
+        cur.execute("CREATE TABLE IF NOT EXISTS job(ID INTEGER PRIMARY KEY, Created REAL, Done INT)")
+        cur.execute("CREATE TABLE IF NOT EXISTS task(Job INT, Seq INT, User TEXT, Shard INT, State TEXT, Worker TEXT, Expires REAL, Attempts INT, Result TEXT)")
+        cur.execute("CREATE INDEX IF NOT EXISTS task_state ON task(Job, State, Shard)")
+        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS task_user ON task(Job, User)")
+
+
+    def shard_of(self, user):
+        """
+        Hashes a user's name into one of the shards. The hash
+        doesn't depend on the process, so every worker agrees
+        on which shard a user belongs to.
+        """
+
+        return int(md5(user.encode("utf-8")).hexdigest(), 16) % self.shards
+
+
+    def create_job(self, userList):
+        """
+        Adds a new job to the queue with one task for each user
+        in userList. Returns the number of the job.
+        """
+
+        cur = self.con.cursor()
+
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("INSERT INTO job VALUES(NULL, ?, 0)", (time(),))
+        job = cur.lastrowid
+
+        for seq, user in enumerate(userList):
+            cur.execute(
+                "INSERT OR IGNORE INTO task VALUES(?, ?, ?, ?, 'pending', NULL, 0, 0, NULL)",
+                (job, seq, user, self.shard_of(user))
+            )
+
+        cur.execute("COMMIT")
+
+        return job
+
+
+    def open_job(self):
+        """
+        Returns the number of the newest job that hasn't been
+        closed yet, or None if there isn't one.
+        """
+
+        cur = self.con.cursor()
+        cur.execute("SELECT ID FROM job WHERE Done=0 ORDER BY ID DESC LIMIT 1")
+
+        row = cur.fetchone()
+
+        if row is None:
+            return None
+
+        return row[0]
+
+
+    def close_job(self, job):
+        """
+        Marks a job as finished and drops its tasks.
+        """
+
+        cur = self.con.cursor()
+
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("UPDATE job SET Done=1 WHERE ID=?", (job,))
+        cur.execute("DELETE FROM task WHERE Job=?", (job,))
+        cur.execute("COMMIT")
+
+
+    def lease(self, job, worker, batchSize, shard=None):
+        """
+        Hands out up to batchSize pending users to a worker. Leases
+        that ran out before their worker finished are put back
+        first. Give it a shard to only lease users from that shard.
+        Returns a list of users.
+        """
+
+        now = time()
+        cur = self.con.cursor()
+
+        cur.execute("BEGIN IMMEDIATE")
+
+        # requeue the users of workers that crashed or stalled
+        cur.execute(
+            "UPDATE task SET State='pending', Worker=NULL WHERE Job=? AND State='leased' AND Expires<?",
+            (job, now)
+        )
+
+        # users that keep killing their workers get dropped
+        cur.execute(
+            "UPDATE task SET State='dropped', Result=NULL WHERE Job=? AND State='pending' AND Attempts>=?",
+            (job, self.maxAttempts)
+        )
+
+        if shard is None:
+            cur.execute(
+                "SELECT Seq, User FROM task WHERE Job=? AND State='pending' ORDER BY Seq LIMIT ?",
+                (job, batchSize)
+            )
+
+        else:
+            cur.execute(
+                "SELECT Seq, User FROM task WHERE Job=? AND State='pending' AND Shard=? ORDER BY Seq LIMIT ?",
+                (job, shard, batchSize)
+            )
+
+        batch = cur.fetchall()
+
+        for seq, user in batch:
+            cur.execute(
+                "UPDATE task SET State='leased', Worker=?, Expires=?, Attempts=Attempts+1 WHERE Job=? AND Seq=?",
+                (worker, now + self.leaseTime, job, seq)
+            )
+
+        cur.execute("COMMIT")
+
+        return [user for seq, user in batch]
+
+
+    def complete(self, job, user, worker, userSubs):
+        """
+        Stores the result of scanning a user. userSubs is the list
+        of (subreddit, best score) pairs that scan_user() returned,
+        or None if the user was skipped. The result is only stored
+        if the worker still holds the lease, since a lease that ran
+        out may have been handed to another worker already. Returns
+        True if the result was stored.
+        """
+
+        if userSubs is not None:
+            userSubs = json.dumps(userSubs)
+
+        cur = self.con.cursor()
+
+        cur.execute(
+            "UPDATE task SET State='done', Result=? WHERE Job=? AND User=? AND State='leased' AND Worker=?",
+            (userSubs, job, user, worker)
+        )
+
+        return cur.rowcount == 1
+
+
+    def remaining(self, job):
+        """
+        Returns how many users of a job haven't been finished.
+        """
+
+        cur = self.con.cursor()
+        cur.execute("SELECT COUNT(*) FROM task WHERE Job=? AND State NOT IN ('done', 'dropped')", (job,))
+
+        return cur.fetchone()[0]
+
+
+    def size(self, job):
+        """
+        Returns how many users a job has in total.
+        """
+
+        cur = self.con.cursor()
+        cur.execute("SELECT COUNT(*) FROM task WHERE Job=?", (job,))
+
+        return cur.fetchone()[0]
+
+
+    def dropped(self, job):
+        """
+        Returns the users of a job that were given up on after
+        maxAttempts leases, in the order they were added.
+        """
+
+        cur = self.con.cursor()
+        cur.execute("SELECT User FROM task WHERE Job=? AND State='dropped' ORDER BY Seq", (job,))
+
+        return [row[0] for row in cur.fetchall()]
+
+
+    def results(self, job):
+        """
+        Yields the stored result of every user in a job in the
+        order the users were added, so that merging them gives
+        the same tally no matter which worker scanned who.
+        """
+
+        cur = self.con.cursor()
+        cur.execute("SELECT Result FROM task WHERE Job=? ORDER BY Seq", (job,))
+
+        for row in cur:
+            if row[0] is None:
+                yield None
+
+            else:
+                yield json.loads(row[0])
+
+
+    def close(self):
+        """
+        Closes the queue's database file.
+        """
+
+        self.con.close()